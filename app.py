@@ -1,7 +1,22 @@
+import asyncio
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from core.database import init_db, close_db_connection
+from fastapi.middleware.gzip import GZipMiddleware
+from core.metrics import MetricsMiddleware, monitor_event_loop, registry
+from core.database import init_db, close_db_connection, get_database, query_recorder
+from core.query_plan import QueryPlanMiddleware
+from database.feedback_writer import feedback_writer
+from database.project_store import project_store
 from core.config import settings
+from auth.jwt_handler import jwks_manager, token_cache
+from services.keycloak import init_keycloak_client, close_keycloak_client
+from services import job_handlers  # noqa: F401 - registers the job handlers
+from services.image_probe import image_probe
+from services.jobs import job_runner
+from services.thumbnail_service import thumbnail_service
+from services.user_directory import user_directory
 from routes.admin import router as AdminRouter
 from routes.user import router as UserRouter
 from routes.project import router as ProjectRouter
@@ -23,17 +38,97 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "X-Total-Count"],
     )
 
+# Compress larger responses (listings, exports)
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE)
+
+# Query plan checks (tests only): fail any request whose queries scan or sort in memory
+if query_recorder is not None:
+    app.add_middleware(QueryPlanMiddleware, recorder=query_recorder, get_database=get_database)
+
+# Outermost, so the timings include every other middleware
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+    # Counters the services already keep, read at scrape time
+    registry.sampled("jwks_cache_hits_total", "JWKS lookups served from memory", lambda: jwks_manager.hits, "counter")
+    registry.sampled("jwks_cache_misses_total", "JWKS lookups that waited on a fetch or found no key", lambda: jwks_manager.misses, "counter")
+    registry.sampled("jwks_cache_hit_ratio", "Share of JWKS lookups served from memory", lambda: jwks_manager.stats()["hit_ratio"])
+    registry.sampled("jwks_fetch_errors_total", "Failed JWKS fetches", lambda: jwks_manager.fetch_errors, "counter")
+    registry.sampled("token_cache_hit_ratio", "Share of bearer tokens found already verified", lambda: token_cache.stats()["hit_ratio"])
+    registry.sampled("feedback_writer_queue_depth", "Feedback waiting to be written", lambda: feedback_writer.stats()["queue_depth"])
+    registry.sampled("job_runner_processed_total", "Jobs this process completed", lambda: job_runner.processed, "counter")
+    registry.sampled("job_runner_failed_total", "Job attempts this process failed", lambda: job_runner.failed, "counter")
+    registry.sampled("thumbnail_cache_hits_total", "Thumbnails served from the disk cache", lambda: thumbnail_service.hits, "counter")
+    registry.sampled("thumbnail_cache_misses_total", "Thumbnails that had to be rendered", lambda: thumbnail_service.misses, "counter")
+    registry.sampled("thumbnail_cache_bytes", "Size of the thumbnail disk cache", lambda: thumbnail_service.cache.stats()["bytes"])
+    registry.sampled("project_store_documents", "Projects held in the in-memory store", lambda: len(project_store))
+
 # Database event handlers
 @app.on_event("startup")
 async def startup_db_client():
     await init_db()
+    if settings.PROJECT_STORE_ENABLED:
+        await project_store.start()
+    if settings.FEEDBACK_WRITE_BEHIND:
+        await feedback_writer.start()
+    if settings.JOB_WORKERS_ENABLED:
+        await job_runner.start()
+
+@app.on_event("startup")
+async def startup_keycloak_client():
+    await init_keycloak_client()
+
+@app.on_event("startup")
+async def startup_jwks():
+    # Warm the key cache so the first authenticated request doesn't wait on Keycloak
+    await jwks_manager.refresh()
+
+@app.on_event("startup")
+async def startup_user_directory():
+    if settings.USER_DIRECTORY_ENABLED:
+        await user_directory.start()
+
+@app.on_event("startup")
+async def startup_thumbnail_service():
+    await thumbnail_service.start()
+
+_loop_monitor = None
+
+@app.on_event("startup")
+async def startup_metrics():
+    global _loop_monitor
+    if settings.METRICS_ENABLED:
+        _loop_monitor = asyncio.create_task(monitor_event_loop(settings.METRICS_LOOP_LAG_INTERVAL))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await job_runner.stop()
+    await project_store.stop()
+    # Flush queued feedback while the client is still open
+    await feedback_writer.stop()
     await close_db_connection()
 
+@app.on_event("shutdown")
+async def shutdown_user_directory():
+    await user_directory.stop()
+
+@app.on_event("shutdown")
+async def shutdown_thumbnail_service():
+    await thumbnail_service.stop()
+    await image_probe.close()
+
+@app.on_event("shutdown")
+async def shutdown_keycloak_client():
+    await close_keycloak_client()
+
+@app.on_event("shutdown")
+async def shutdown_metrics():
+    if _loop_monitor is not None:
+        _loop_monitor.cancel()
+
 # Include routers
 app.include_router(AdminRouter, prefix="/admin", tags=["Admin"])
 app.include_router(UserRouter, prefix="/user", tags=["User"])
@@ -47,3 +142,10 @@ async def root():
         "docs": "/docs",
         "version": "1.0.0"
     }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint. Values are per process."""
+    if not settings.METRICS_ENABLED:
+        return PlainTextResponse("Metrics are disabled", status_code=404)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
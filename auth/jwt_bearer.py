@@ -20,7 +20,7 @@ class JWTBearer(HTTPBearer):
         if not credentials.scheme == "Bearer":
             raise HTTPException(status_code=403, detail="Invalid authentication scheme.")
         
-        payload = decode_jwt(credentials.credentials)
+        payload = await decode_jwt(credentials.credentials)
         
         if not payload:
             raise HTTPException(status_code=403, detail="Invalid or expired token.")
@@ -1,77 +1,234 @@
-import requests
+import asyncio
+import hashlib
 import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import httpx
 from jose import jwt
 from jose.exceptions import JOSEError
 from core.config import settings
+from services.keycloak import get_keycloak_client
+from .verifiers import TokenVerificationError, get_verifier
 
-# A simple in-memory cache for JWKS to avoid fetching on every request
-jwks_cache = {
-    "keys": [],
-    "expires_at": 0
-}
 
-def get_jwks():
+class JWKSManager:
     """
-    Fetches the JSON Web Key Set (JWKS) from Keycloak.
-    Keys are cached for 10 minutes.
+    Keeps Keycloak's JSON Web Key Set in memory, indexed by `kid`.
+
+    Keys are considered fresh for `ttl` seconds. After that they are still
+    served (stale-while-revalidate) while a single background refresh runs,
+    up to `max_stale` seconds, after which callers wait for the refresh.
+    An unknown `kid` triggers an immediate refetch, at most once every
+    `min_refresh_interval` seconds. That limit doesn't apply while no keys
+    are loaded (e.g. the startup fetch failed), so the next request retries.
     """
-    global jwks_cache
-    if time.time() < jwks_cache["expires_at"]:
-        return jwks_cache["keys"]
 
-    try:
-        jwks_url = f"{settings.KEYCLOAK_URL}/realms/{settings.REALM}/protocol/openid-connect/certs"
-        response = requests.get(jwks_url, timeout=10)
-        response.raise_for_status()
-        jwks = response.json()
-        
-        # Cache for 10 minutes
-        jwks_cache["keys"] = jwks.get("keys", [])
-        jwks_cache["expires_at"] = time.time() + 600
-        
-        return jwks_cache["keys"]
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching JWKS from Keycloak: {e}")
-        return []
-
-def decode_jwt(token: str) -> dict:
+    def __init__(self, url: str, ttl: float, max_stale: float, min_refresh_interval: float, timeout: float):
+        self.url = url
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys: Dict[str, dict] = {}
+        # Bumped whenever the key set changes, so dependent caches can drop entries
+        self.version = 0
+        self._fetched_at = 0.0
+        self._last_attempt = float("-inf")
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Lookups answered from memory vs. those that had to wait on a fetch
+        self.hits = 0
+        self.misses = 0
+        self.fetch_errors = 0
+
+    @property
+    def keys(self) -> Dict[str, dict]:
+        return self._keys
+
+    async def get_key(self, kid: str) -> Optional[dict]:
+        waited = False
+        age = time.monotonic() - self._fetched_at
+        if not self._keys or age >= self.max_stale:
+            if self._refreshing() or self._refresh_allowed():
+                waited = True
+                await self.refresh()
+        elif age >= self.ttl and self._refresh_allowed():
+            self._start_refresh()
+
+        key = self._keys.get(kid)
+        if key is None and not waited and (self._refreshing() or self._refresh_allowed()):
+            # Keycloak may have rotated its keys; refetch right away
+            waited = True
+            await self.refresh()
+            key = self._keys.get(kid)
+        if key is None or waited:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key
+
+    async def refresh(self) -> None:
+        """Refresh the key set. Concurrent callers share one in-flight fetch."""
+        await asyncio.shield(self._start_refresh())
+
+    def _refreshing(self) -> bool:
+        return self._refresh_task is not None and not self._refresh_task.done()
+
+    def _refresh_allowed(self) -> bool:
+        if not self._keys:
+            return True
+        return time.monotonic() - self._last_attempt >= self.min_refresh_interval
+
+    def _start_refresh(self) -> asyncio.Task:
+        if not self._refreshing():
+            self._refresh_task = asyncio.create_task(self._fetch())
+        return self._refresh_task
+
+    async def _fetch(self) -> None:
+        self._last_attempt = time.monotonic()
+        try:
+            response = await get_keycloak_client().get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            jwks = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            # Keep serving the keys we already have
+            self.fetch_errors += 1
+            print(f"Error fetching JWKS from Keycloak: {e}")
+            return
+
+        keys = {}
+        for key in jwks.get("keys", []):
+            if key.get("kid") and key.get("kty") == "RSA":
+                keys[key["kid"]] = {
+                    "kty": key["kty"],
+                    "kid": key["kid"],
+                    "use": key.get("use", "sig"),
+                    "n": key["n"],
+                    "e": key["e"],
+                }
+        if keys != self._keys:
+            self.version += 1
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "keys": len(self._keys),
+            "age": time.monotonic() - self._fetched_at if self._keys else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "fetch_errors": self.fetch_errors,
+        }
+
+
+jwks_manager = JWKSManager(
+    url=f"{settings.KEYCLOAK_URL}/realms/{settings.REALM}/protocol/openid-connect/certs",
+    ttl=settings.JWKS_CACHE_TTL,
+    max_stale=settings.JWKS_MAX_STALE,
+    min_refresh_interval=settings.JWKS_MIN_REFRESH_INTERVAL,
+    timeout=settings.JWKS_FETCH_TIMEOUT,
+)
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified token payloads, keyed by a SHA-256 hash of the token.
+
+    An entry lives until the token's `exp` (or `max_ttl`, whichever comes first)
+    and is dropped as soon as the JWKS key set changes.
+    """
+
+    def __init__(self, maxsize: int, max_ttl: float):
+        self.maxsize = maxsize
+        self.max_ttl = max_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[dict, float, int]]" = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str, keys_version: int) -> Optional[dict]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is not None:
+            payload, expires_at, version = entry
+            if version == keys_version and time.time() < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, token: str, payload: dict, keys_version: int) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.time() + self.max_ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        key = self._key(token)
+        self._entries[key] = (payload, expires_at, keys_version)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+verifier = get_verifier(settings.JWT_VERIFIER_BACKEND)
+
+token_cache = VerifiedTokenCache(
+    maxsize=settings.TOKEN_CACHE_SIZE,
+    max_ttl=settings.TOKEN_CACHE_MAX_TTL,
+)
+
+
+async def decode_jwt(token: str) -> dict:
     """
     Decodes and validates a JWT from Keycloak using its public key.
+    Payloads of tokens that were already verified are served from `token_cache`.
     """
+    cached = token_cache.get(token, jwks_manager.version)
+    if cached is not None:
+        return cached
+
     try:
         unverified_header = jwt.get_unverified_header(token)
         kid = unverified_header.get("kid")
-        
-        jwks = get_jwks()
-        if not jwks:
+        if not kid:
             return {}
 
-        rsa_key = {}
-        for key in jwks:
-            if key["kid"] == kid:
-                rsa_key = {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"]
-                }
-                break
-
+        rsa_key = await jwks_manager.get_key(kid)
         if rsa_key:
-            payload = jwt.decode(
+            payload = verifier.verify(
                 token,
                 rsa_key,
-                algorithms=["RS256"],
                 audience=settings.CLIENT_ID,
                 issuer=f"{settings.KEYCLOAK_URL}/realms/{settings.REALM}"
             )
+            token_cache.put(token, payload, jwks_manager.version)
             return payload
-            
-    except JOSEError as e:
+
+    except (JOSEError, TokenVerificationError) as e:
         # This will catch expired signatures, invalid claims, etc.
         print(f"JWT decoding error: {e}")
     except Exception as e:
         print(f"An unexpected error occurred during JWT decoding: {e}")
-        
-    return {}
\ No newline at end of file
+
+    return {}
@@ -0,0 +1,145 @@
+import base64
+import json
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+from jose import jwt
+from jose.exceptions import JOSEError
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey, RSAPublicNumbers
+except ImportError:  # pragma: no cover - optional dependency
+    RSAPublicKey = None
+
+
+class TokenVerificationError(Exception):
+    """Raised when a token's signature or claims fail verification."""
+
+
+class SignatureVerifier(ABC):
+    """Verifies an RS256 token against a JWK and returns its validated claims."""
+
+    name = "base"
+
+    @abstractmethod
+    def verify(self, token: str, jwk: dict, audience: Optional[str], issuer: Optional[str]) -> dict:
+        """Returns the token's claims, or raises TokenVerificationError."""
+
+
+class JoseVerifier(SignatureVerifier):
+    """Verification through python-jose, using whichever RSA backend it picked."""
+
+    name = "jose"
+
+    def verify(self, token: str, jwk: dict, audience: Optional[str], issuer: Optional[str]) -> dict:
+        try:
+            return jwt.decode(token, jwk, algorithms=["RS256"], audience=audience, issuer=issuer)
+        except JOSEError as e:
+            raise TokenVerificationError(str(e)) from e
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _b64_to_int(segment: str) -> int:
+    return int.from_bytes(_b64decode(segment), "big")
+
+
+class CryptographyVerifier(SignatureVerifier):
+    """
+    Verification through the `cryptography` package (OpenSSL).
+
+    Public keys are parsed once per JWK and reused, so each call only pays
+    for the signature check and the claim validation.
+    """
+
+    name = "cryptography"
+    max_cached_keys = 64
+
+    def __init__(self):
+        if RSAPublicKey is None:
+            raise RuntimeError("The 'cryptography' package is required for this verifier")
+        self._public_keys: Dict[Tuple[str, str, str], RSAPublicKey] = {}
+
+    def _public_key(self, jwk: dict) -> RSAPublicKey:
+        cache_key = (jwk.get("kid", ""), jwk["n"], jwk["e"])
+        key = self._public_keys.get(cache_key)
+        if key is None:
+            if len(self._public_keys) >= self.max_cached_keys:
+                self._public_keys.clear()
+            key = RSAPublicNumbers(_b64_to_int(jwk["e"]), _b64_to_int(jwk["n"])).public_key()
+            self._public_keys[cache_key] = key
+        return key
+
+    def verify(self, token: str, jwk: dict, audience: Optional[str], issuer: Optional[str]) -> dict:
+        try:
+            signing_input, _, signature = token.rpartition(".")
+            header_segment, _, payload_segment = signing_input.partition(".")
+            header = json.loads(_b64decode(header_segment))
+            if header.get("alg") != "RS256":
+                raise TokenVerificationError("The specified alg value is not allowed")
+            self._public_key(jwk).verify(
+                _b64decode(signature),
+                signing_input.encode(),
+                padding.PKCS1v15(),
+                hashes.SHA256(),
+            )
+            claims = json.loads(_b64decode(payload_segment))
+        except InvalidSignature as e:
+            raise TokenVerificationError("Signature verification failed.") from e
+        except (ValueError, TypeError, KeyError) as e:
+            raise TokenVerificationError(f"Error decoding token: {e}") from e
+
+        if not isinstance(claims, dict):
+            raise TokenVerificationError("Invalid payload string: must be a json object")
+        self._validate_claims(claims, audience, issuer)
+        return claims
+
+    @staticmethod
+    def _validate_claims(claims: dict, audience: Optional[str], issuer: Optional[str]) -> None:
+        # Mirrors python-jose's default claim checks so both backends accept the same tokens
+        now = int(time.time())
+        try:
+            if "iat" in claims:
+                int(claims["iat"])
+            if "nbf" in claims and int(claims["nbf"]) > now:
+                raise TokenVerificationError("The token is not yet valid (nbf)")
+            if "exp" in claims and int(claims["exp"]) < now:
+                raise TokenVerificationError("Signature has expired.")
+        except (ValueError, TypeError) as e:
+            raise TokenVerificationError("Invalid time claim in token") from e
+
+        if "aud" in claims:
+            audience_claims = claims["aud"]
+            if isinstance(audience_claims, str):
+                audience_claims = [audience_claims]
+            if not isinstance(audience_claims, list) or any(not isinstance(c, str) for c in audience_claims):
+                raise TokenVerificationError("Invalid claim format in token")
+            if audience not in audience_claims:
+                raise TokenVerificationError("Invalid audience")
+
+        if issuer is not None and claims.get("iss") != issuer:
+            raise TokenVerificationError("Invalid issuer")
+
+
+VERIFIERS = {
+    JoseVerifier.name: JoseVerifier,
+    CryptographyVerifier.name: CryptographyVerifier,
+}
+
+
+def get_verifier(name: str = "auto") -> SignatureVerifier:
+    """
+    Returns the verifier registered under `name`. "auto" prefers the
+    cryptography backend and falls back to python-jose when it isn't installed.
+    """
+    if name == "auto":
+        name = CryptographyVerifier.name if RSAPublicKey is not None else JoseVerifier.name
+    if name not in VERIFIERS:
+        raise ValueError(f"Unknown JWT verifier backend: {name}")
+    return VERIFIERS[name]()
@@ -0,0 +1,120 @@
+"""
+Benchmark for project search against a synthetic corpus.
+
+Loads N synthetic projects into a scratch database, then times the old
+unanchored `$regex` scan against database.project.search_projects, which
+uses the `$text` index for complete words and a search_tokens prefix match
+for the word still being typed. The scratch database is dropped afterwards.
+
+    BENCH_MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.bench_project_search --projects 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("MONGODB_URI", os.environ.get("BENCH_MONGODB_URI", "mongodb://localhost:27017"))
+os.environ.setdefault("MONGODB_DB", "bench_project_search")
+for _name in ("KEYCLOAK_URL", "REALM", "CLIENT_ID", "CLIENT_SECRET"):
+    os.environ.setdefault(_name, "bench")
+
+from beanie import init_beanie  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from database.project import search_projects  # noqa: E402
+from models.project import Project, search_tokens  # noqa: E402
+
+WORDS = (
+    "vision language model robot drone health finance climate graph search agent speech "
+    "translation medical chatbot recommender anomaly detection forecasting segmentation "
+    "tracking retrieval summarization sentiment fraud energy traffic farming education"
+).split()
+TAGS = ["fastapi", "mongodb", "pytorch", "react", "tensorflow", "langchain", "opencv", "llm", "rag", "iot"]
+NAMES = ["Alice", "Bob", "Chamara", "Dilini", "Eshan", "Fathima", "Gayan", "Hiruni", "Isuru", "Janani"]
+# A trailing space marks the last word as complete, so it goes through the text
+# index; without one it is matched as a prefix of search_tokens
+QUERIES = ["drone", "dro", "medical chatbot", "medical chatbot ", "pytorch ", "Hiruni", "fraud detection ", "2024 "]
+
+
+def synthetic_project(i: int, rng: random.Random) -> dict:
+    created = datetime(2020, 1, 1) + timedelta(minutes=i)
+    project = {
+        # Numbered so (batch, topic) stays unique, as the batch_topic_unique index requires
+        "topic": f"{' '.join(rng.sample(WORDS, 3)).title()} {i}",
+        "description": " ".join(rng.choices(WORDS, k=60)),
+        "batch": str(rng.randint(2018, 2026)),
+        "contributors": rng.sample(NAMES, 3),
+        "search_tags": rng.sample(TAGS, 3),
+        "date": created,
+        "image": f"https://example.com/{i}.png",
+        "width": 1200,
+        "height": 630,
+        "visibility": rng.random() > 0.1,
+        "featured": rng.random() > 0.8,
+        "created_at": created,
+    }
+    # Inserted raw, so fill in what Project's before_event hook would
+    project["search_tokens"] = search_tokens(project)
+    return project
+
+
+async def regex_search(collection, query: str, limit: int) -> list:
+    """The previous implementation: case-insensitive, unanchored regex on two fields."""
+    cursor = collection.find({
+        "$and": [
+            {"$or": [
+                {"topic": {"$regex": query, "$options": "i"}},
+                {"description": {"$regex": query, "$options": "i"}},
+            ]},
+            {"visibility": True},
+        ]
+    }).limit(limit)
+    return await cursor.to_list(None)
+
+
+async def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ["MONGODB_URI"])
+    database = client[os.environ["MONGODB_DB"]]
+    await client.drop_database(database.name)
+    try:
+        await init_beanie(database=database, document_models=[Project])
+        collection = Project.get_motor_collection()
+
+        rng = random.Random(42)
+        batch = []
+        for i in range(args.projects):
+            batch.append(synthetic_project(i, rng))
+            if len(batch) == 5000:
+                await collection.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            await collection.insert_many(batch, ordered=False)
+        print(f"Loaded {args.projects} projects\n")
+
+        print(f"{'query':<20}{'regex ms':>12}{'text ms':>12}{'speedup':>10}")
+        for query in QUERIES:
+            regex_ms = await timed(lambda: regex_search(collection, query.strip(), args.limit), args.repeat)
+            text_ms = await timed(lambda: search_projects(query, limit=args.limit), args.repeat)
+            print(f"{query!r:<20}{regex_ms:>12.2f}{text_ms:>12.2f}{regex_ms / text_ms:>9.1f}x")
+    finally:
+        await client.drop_database(database.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Before/after benchmark for the /projects/all response path with N projects.
+
+"before" is the previous route: Beanie documents, revalidated into
+ProjectListSchema by the response_model, then encoded with the standard
+JSON encoder. "after" is the raw-document fast path in core/serialization.py.
+Projects are loaded into a scratch database that is dropped afterwards.
+
+    BENCH_MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.bench_serialization --projects 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+os.environ.setdefault("MONGODB_URI", os.environ.get("BENCH_MONGODB_URI", "mongodb://localhost:27017"))
+os.environ.setdefault("MONGODB_DB", "bench_serialization")
+for _name in ("KEYCLOAK_URL", "REALM", "CLIENT_ID", "CLIENT_SECRET"):
+    os.environ.setdefault(_name, "bench")
+
+from beanie import init_beanie  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from benchmarks.bench_project_search import synthetic_project  # noqa: E402
+from core.serialization import FastJSONResponse, documents_payload  # noqa: E402
+from database import project as project_db  # noqa: E402
+from models.project import Project  # noqa: E402
+from schemas.project import ProjectListSchema, ProjectSchema  # noqa: E402
+
+response_adapter = TypeAdapter(ProjectListSchema)
+
+
+async def before(limit: int):
+    fetch_start = time.perf_counter()
+    projects = await Project.find({"visibility": True}).sort("-created_at").limit(limit).to_list()
+    fetched = time.perf_counter()
+    content = ProjectListSchema(projects=projects)
+    # What FastAPI does with a response_model: validate, dump to JSON-able data, json.dumps
+    value = response_adapter.validate_python(content, from_attributes=True)
+    body = json.dumps(response_adapter.dump_python(value, mode="json")).encode("utf-8")
+    return fetched - fetch_start, time.perf_counter() - fetched, len(body)
+
+
+async def after(limit: int):
+    fetch_start = time.perf_counter()
+    projects, _ = await project_db.list_projects(limit=limit, raw=True)
+    fetched = time.perf_counter()
+    body = FastJSONResponse({"projects": documents_payload(projects, ProjectSchema)}).body
+    return fetched - fetch_start, time.perf_counter() - fetched, len(body)
+
+
+async def measure(fn, limit: int, repeat: int):
+    fetch_total = serialize_total = 0.0
+    size = 0
+    for _ in range(repeat):
+        fetch, serialize, size = await fn(limit)
+        fetch_total += fetch
+        serialize_total += serialize
+    return fetch_total / repeat * 1000, serialize_total / repeat * 1000, size
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ["MONGODB_URI"])
+    database = client[os.environ["MONGODB_DB"]]
+    await client.drop_database(database.name)
+    try:
+        await init_beanie(database=database, document_models=[Project])
+        rng = random.Random(42)
+        docs = [dict(synthetic_project(i, rng), visibility=True) for i in range(args.projects)]
+        await Project.get_motor_collection().insert_many(docs, ordered=False)
+        print(f"Loaded {args.projects} projects\n")
+
+        print(f"{'path':<8}{'fetch ms':>12}{'serialize ms':>15}{'total ms':>12}{'bytes':>12}")
+        for name, fn in (("before", before), ("after", after)):
+            fetch, serialize, size = await measure(fn, args.projects, args.repeat)
+            print(f"{name:<8}{fetch:>12.1f}{serialize:>15.1f}{fetch + serialize:>12.1f}{size:>12}")
+    finally:
+        await client.drop_database(database.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
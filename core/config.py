@@ -1,3 +1,5 @@
+from typing import Dict, List, Tuple
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -6,6 +8,84 @@ class Settings(BaseSettings):
     # MongoDB settings
     MONGODB_URI: str
     MONGODB_DB: str
+    # Drop indexes the models don't declare at startup (also removes hand-made ones)
+    MONGODB_RECONCILE_INDEXES: bool = False
+
+    # Pagination
+    DEFAULT_PAGE_SIZE: int = 50
+    MAX_PAGE_SIZE: int = 500
+    COUNT_CACHE_TTL: float = 30
+
+    # Known-visible project ids used by feedback existence checks
+    VISIBLE_ID_CACHE_TTL: float = 30
+    VISIBLE_ID_CACHE_SIZE: int = 10000
+
+    # Write-behind batching of feedback inserts (window in seconds)
+    FEEDBACK_WRITE_BEHIND: bool = False
+    FEEDBACK_BATCH_SIZE: int = 500
+    FEEDBACK_BATCH_WINDOW: float = 0.05
+    # True: wait for the batch to be acknowledged; False: return the generated id immediately
+    FEEDBACK_WAIT_FOR_WRITE: bool = True
+    # Parallel find-and-modify calls per bulk moderation request
+    FEEDBACK_MODERATION_CONCURRENCY: int = 20
+
+    # NDJSON project import
+    IMPORT_BATCH_SIZE: int = 500
+    IMPORT_MAX_LINE_BYTES: int = 1_000_000
+
+    # Streaming export (documents per cursor round trip)
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # Responses smaller than this (bytes) are sent uncompressed
+    GZIP_MINIMUM_SIZE: int = 1000
+
+    # Thumbnails (sizes in pixels, cache in bytes, timeouts in seconds)
+    THUMBNAIL_CACHE_DIR: str = ".cache/thumbnails"
+    THUMBNAIL_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    THUMBNAIL_CACHE_MAX_AGE: int = 86400
+    # Render processes; 0 means one per CPU
+    THUMBNAIL_WORKERS: int = 0
+    THUMBNAIL_DEFAULT_WIDTH: int = 400
+    # (width, height) boxes the public GET /utils/thumbnail renders; include the default
+    THUMBNAIL_SIZES: List[Tuple[int, int]] = [(200, 200), (400, 400), (800, 800), (1200, 630)]
+    THUMBNAIL_MAX_DIMENSION: int = 1600
+    THUMBNAIL_DEFAULT_FORMAT: str = "webp"
+    THUMBNAIL_QUALITY: int = 80
+    THUMBNAIL_FETCH_TIMEOUT: float = 10
+    THUMBNAIL_MAX_SOURCE_BYTES: int = 20 * 1024 * 1024
+
+    # Image dimension probing (range-request header reads)
+    IMAGE_PROBE_CONCURRENCY: int = 16
+    IMAGE_PROBE_MAX_BYTES: int = 256 * 1024
+    IMAGE_PROBE_TIMEOUT: float = 10
+    IMAGE_PROBE_CACHE_TTL: float = 3600
+    IMAGE_PROBE_CACHE_SIZE: int = 10000
+
+    # Let thumbnail/probe fetches reach private or loopback addresses (local test servers)
+    FETCH_ALLOW_PRIVATE_HOSTS: bool = False
+
+    # Background jobs: concurrent loops per queue in each process, times in seconds
+    JOB_WORKERS_ENABLED: bool = True
+    JOB_QUEUES: Dict[str, int] = {"default": 2, "images": 4}
+    JOB_LEASE_SECONDS: float = 60
+    JOB_POLL_INTERVAL: float = 2
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_DELAY: float = 5
+    JOB_RETRY_MAX_DELAY: float = 600
+    JOB_RETENTION_SECONDS: int = 7 * 24 * 3600
+    # Check the image size of created/updated projects in the background
+    JOB_PROBE_ON_WRITE: bool = True
+
+    # In-memory project store fed by a change stream (needs a replica set)
+    PROJECT_STORE_ENABLED: bool = True
+
+    # HTTP caching of public project reads (seconds)
+    VERSION_CACHE_TTL: float = 1
+    PUBLIC_CACHE_MAX_AGE: int = 30
+    PUBLIC_CACHE_STALE_WHILE_REVALIDATE: int = 300
+
+    # Explain every query a request issues and fail on COLLSCAN / in-memory SORT (tests only)
+    QUERY_PLAN_CHECK: bool = False
     
     # Keycloak Settings
     KEYCLOAK_URL: str
@@ -13,6 +93,47 @@ class Settings(BaseSettings):
     CLIENT_ID: str
     CLIENT_SECRET: str
 
+    # Keycloak HTTP client (seconds / connection counts)
+    KEYCLOAK_TIMEOUT: float = 10
+    KEYCLOAK_CONNECT_TIMEOUT: float = 5
+    KEYCLOAK_MAX_CONNECTIONS: int = 100
+    KEYCLOAK_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    KEYCLOAK_KEEPALIVE_EXPIRY: float = 30
+    KEYCLOAK_HTTP2: bool = False
+
+    # Service-account token cache (seconds)
+    KEYCLOAK_TOKEN_EXPIRY_SKEW: float = 10
+    KEYCLOAK_TOKEN_REFRESH_AHEAD: float = 30
+    KEYCLOAK_TOKEN_RETRY_INTERVAL: float = 5
+
+    # Local Keycloak user directory
+    USER_DIRECTORY_ENABLED: bool = True
+    USER_DIRECTORY_PAGE_SIZE: int = 100
+    # Seconds between incremental (event-based) syncs, and between full rebuilds
+    USER_DIRECTORY_SYNC_INTERVAL: float = 300
+    USER_DIRECTORY_FULL_SYNC_INTERVAL: float = 3600
+    USER_BATCH_CONCURRENCY: int = 10
+
+    # JWKS cache (seconds)
+    JWKS_CACHE_TTL: float = 600
+    JWKS_MAX_STALE: float = 3600
+    JWKS_MIN_REFRESH_INTERVAL: float = 30
+    JWKS_FETCH_TIMEOUT: float = 10
+
+    # Verified token cache
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_MAX_TTL: float = 300
+
+    # Signature verification backend: "auto", "cryptography" or "jose"
+    JWT_VERIFIER_BACKEND: str = "auto"
+
+    # Prometheus metrics at /metrics
+    METRICS_ENABLED: bool = True
+    # Label combinations kept per metric; the rest are counted under "other"
+    METRICS_MAX_SERIES: int = 500
+    # Seconds between event loop lag samples
+    METRICS_LOOP_LAG_INTERVAL: float = 0.5
+
     # Auth toggles
     DISABLE_AUTH: bool = False
     
@@ -2,18 +2,35 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 
 from models.feedback import Feedback
+from models.job import Job
 from models.project import Project
 from core.config import settings
+from core.mongo_metrics import MongoMetricsListener
+from core.query_plan import QueryRecorder
+from database.migrations import ensure_unique_batch_topic
+
+# Records every query for explain checks when QUERY_PLAN_CHECK is enabled (tests only)
+query_recorder = QueryRecorder(settings.MONGODB_DB) if settings.QUERY_PLAN_CHECK else None
+
+# Command timings for /metrics
+mongo_metrics = MongoMetricsListener() if settings.METRICS_ENABLED else None
 
 # Global database client
-client = AsyncIOMotorClient(settings.MONGODB_URI)
+client = AsyncIOMotorClient(
+    settings.MONGODB_URI,
+    event_listeners=[listener for listener in (query_recorder, mongo_metrics) if listener],
+)
 
 async def init_db():
     """Initialize database connection and set up ODM."""
     try:
+        # Existing duplicates would otherwise stop the unique (batch, topic) index from building
+        await ensure_unique_batch_topic(client[settings.MONGODB_DB])
         await init_beanie(
             database=client[settings.MONGODB_DB],
-            document_models=[Feedback, Project]
+            document_models=[Feedback, Job, Project],
+            # Drop indexes that are no longer declared on the models
+            allow_index_dropping=settings.MONGODB_RECONCILE_INDEXES,
         )
         print("Database initialized successfully")
     except Exception as e:
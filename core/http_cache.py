@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+from core.config import settings
+
+
+def make_etag(name: str, version: int) -> str:
+    return f'W/"{name}-{version}"'
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime]) -> Dict[str, str]:
+    headers = {
+        "ETag": etag,
+        "Cache-Control": (
+            f"public, max-age={settings.PUBLIC_CACHE_MAX_AGE}, "
+            f"stale-while-revalidate={settings.PUBLIC_CACHE_STALE_WHILE_REVALIDATE}"
+        ),
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" match
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def _not_modified_since(if_modified_since: str, last_modified: Optional[datetime]) -> bool:
+    if last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have second precision
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def not_modified(request: Request, headers: Dict[str, str], last_modified: Optional[datetime]) -> Optional[Response]:
+    """
+    Returns a 304 response when the client's copy is still current, otherwise None.
+    If-None-Match takes precedence over If-Modified-Since (RFC 9110).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, headers["ETag"])
+    else:
+        fresh = _not_modified_since(request.headers.get("if-modified-since", ""), last_modified)
+    if fresh:
+        return Response(status_code=304, headers=headers)
+    return None
@@ -0,0 +1,297 @@
+"""
+Minimal in-process metrics in the Prometheus text format (served at /metrics).
+
+Counters, gauges and histograms live in one registry, and each metric
+tracks at most METRICS_MAX_SERIES label combinations. Further combinations
+are folded into one series whose labels are all "other", so an unexpected
+label value (an id in a path, say) can't blow up memory or the scrape. Updates
+take a per-metric lock because pymongo reports commands from driver threads.
+
+Values are per process. With several uvicorn workers, each scrape sees one
+worker's numbers. Scrape every worker, or run one per pod.
+"""
+import asyncio
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Pattern, Sequence, Tuple
+
+from starlette.routing import compile_path
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import settings
+
+Labels = Tuple[str, ...]
+
+# Seconds; covers fast cache hits up to slow exports
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), max_series: Optional[int] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series or settings.METRICS_MAX_SERIES
+        self._series: Dict[Labels, object] = {}
+        self._lock = threading.Lock()
+        self._overflow: Labels = ("other",) * len(self.labelnames)
+
+    def _key(self, labels: Sequence[str]) -> Labels:
+        key = tuple(str(value) for value in labels)
+        if key not in self._series and len(self._series) >= self.max_series:
+            return self._overflow
+        return key
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Lines of this metric in the Prometheus text format."""
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = list(self._series.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in series
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS, max_series: Optional[int] = None):
+        super().__init__(name, help, labelnames, max_series)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels: str, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        lines = self._header()
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Sampled(_Metric):
+    """Gauge or counter whose value is read from `sample()` at scrape time (existing stats counters)."""
+
+    def __init__(self, name: str, help: str, sample: Callable[[], float], type: str = "gauge"):
+        super().__init__(name, help)
+        self.type = type
+        self.sample = sample
+
+    def render(self) -> List[str]:
+        try:
+            value = self.sample()
+        except Exception as e:
+            print(f"Error sampling metric {self.name}: {e}")
+            return []
+        return self._header() + [f"{self.name} {_format_value(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, tuple(labelnames)))
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, tuple(labelnames)))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, tuple(labelnames), buckets))
+
+    def sampled(self, name: str, help: str, sample: Callable[[], float], type: str = "gauge") -> Sampled:
+        return self.register(Sampled(name, help, sample, type))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- HTTP ---
+
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "Requests currently being handled", ("method", "route")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time to send the full response", ("method", "route", "status")
+)
+
+
+class RouteTemplates:
+    """
+    Maps a request to the path template of its route ("/projects/{projectId}").
+
+    Built on first use from the OpenAPI paths (full paths of every included
+    router) plus the app's own routes, so it works however the FastAPI
+    version nests included routers.
+    """
+
+    def __init__(self):
+        self._routes: Optional[List[Tuple[Pattern, frozenset, str]]] = None
+
+    def _build(self, app) -> List[Tuple[Pattern, frozenset, str]]:
+        routes = []
+        try:
+            for path, operations in app.openapi().get("paths", {}).items():
+                routes.append((compile_path(path)[0], frozenset(method.upper() for method in operations), path))
+        except Exception as e:
+            print(f"Error reading routes for metrics: {e}")
+        for route in app.router.routes:
+            path = getattr(route, "path", None)
+            if isinstance(path, str) and getattr(route, "path_regex", None) is not None:
+                routes.append((route.path_regex, frozenset(getattr(route, "methods", None) or ()), path))
+        return routes
+
+    def resolve(self, scope: Scope) -> str:
+        if self._routes is None:
+            self._routes = self._build(scope["app"])
+        path = scope["path"]
+        method = scope["method"]
+        fallback = None
+        for regex, methods, template in self._routes:
+            if regex.match(path):
+                if not methods or method in methods or (method == "HEAD" and "GET" in methods):
+                    return template
+                # Path matched but not the method (405)
+                fallback = fallback or template
+        return fallback or "unmatched"
+
+
+class MetricsMiddleware:
+    """Per-route in-flight gauge and latency histogram. Labels use route templates, never raw paths."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.routes = RouteTemplates()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self.routes.resolve(scope)
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method, route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec(method, route)
+            http_request_duration.observe(method, route, str(status), value=time.perf_counter() - started)
+
+
+# --- MongoDB ---
+
+mongodb_command_duration = registry.histogram(
+    "mongodb_command_duration_seconds", "MongoDB command round trips", ("collection", "command")
+)
+mongodb_command_errors = registry.counter(
+    "mongodb_command_errors_total", "MongoDB commands that failed", ("collection", "command")
+)
+
+# --- Keycloak ---
+
+keycloak_request_duration = registry.histogram(
+    "keycloak_request_duration_seconds", "Keycloak HTTP calls", ("operation",)
+)
+keycloak_errors = registry.counter(
+    "keycloak_errors_total", "Keycloak calls that failed or returned an error status", ("operation", "reason")
+)
+
+# --- Event loop ---
+
+event_loop_lag = registry.histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke up a sleeping task",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+event_loop_lag_last = registry.gauge("event_loop_lag_last_seconds", "Most recent event loop lag sample")
+
+
+async def monitor_event_loop(interval: float) -> None:
+    """Sleep `interval` seconds in a loop and record how much later than asked the loop resumed us."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - started - interval)
+        event_loop_lag.observe(value=lag)
+        event_loop_lag_last.set(value=lag)
@@ -0,0 +1,57 @@
+import threading
+from typing import Dict, Tuple
+
+from pymongo import monitoring
+
+from core.metrics import mongodb_command_duration, mongodb_command_errors
+
+# Commands whose first value is not a collection name
+_NO_COLLECTION = {"getMore", "killCursors", "endSessions", "hello", "isMaster", "ismaster", "ping", "buildInfo", "saslStart", "saslContinue"}
+
+# Connection handshakes and heartbeats, not application queries
+_SKIPPED = {"hello", "isMaster", "ismaster", "saslStart", "saslContinue", "endSessions"}
+
+_MAX_PENDING = 10000
+
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """
+    Times MongoDB commands by collection and command name. The collection
+    only appears in the started event, so it is remembered until the
+    matching succeeded/failed event. Called from driver threads.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[object, int], str] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name in _SKIPPED:
+            return
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        elif event.command_name in _NO_COLLECTION:
+            collection = None
+        else:
+            collection = event.command.get(event.command_name)
+        with self._lock:
+            if len(self._pending) >= _MAX_PENDING:
+                # Events lost to a dropped connection; don't let them pile up
+                self._pending.clear()
+            self._pending[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ""
+
+    def _finish(self, event) -> str:
+        with self._lock:
+            return self._pending.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        if event.command_name in _SKIPPED:
+            return
+        mongodb_command_duration.observe(self._finish(event), event.command_name, value=event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        if event.command_name in _SKIPPED:
+            return
+        collection = self._finish(event)
+        mongodb_command_duration.observe(collection, event.command_name, value=event.duration_micros / 1e6)
+        mongodb_command_errors.inc(collection, event.command_name)
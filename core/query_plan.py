@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional
+
+from pymongo import monitoring
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Commands whose plans we check; the command name's value is the collection
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+
+# Session / transport fields the server rejects inside an explain
+_STRIPPED_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+
+# Commands of the request being handled; motor copies the context into its
+# executor threads, so the listener sees the request that issued the command
+_recorded: ContextVar[Optional[List[dict]]] = ContextVar("query_plan_recorded", default=None)
+
+
+class QueryPlanError(Exception):
+    """Raised when a recorded query is executed with a collection scan or an in-memory sort."""
+
+
+class QueryRecorder(monitoring.CommandListener):
+    """
+    Records the read and write commands sent inside `recording()`, so their
+    plans can be explained afterwards. Commands issued outside of it (other
+    requests, background tasks) are ignored. Only registered when
+    QUERY_PLAN_CHECK is on.
+    """
+
+    def __init__(self, database_name: str):
+        self.database_name = database_name
+
+    @contextmanager
+    def recording(self) -> Iterator[List[dict]]:
+        commands: List[dict] = []
+        token = _recorded.set(commands)
+        try:
+            yield commands
+        finally:
+            _recorded.reset(token)
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        commands = _recorded.get()
+        if commands is None:
+            return
+        if event.database_name != self.database_name or event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        command = {
+            key: value
+            for key, value in event.command.items()
+            if not key.startswith("$") and key not in _STRIPPED_FIELDS
+        }
+        commands.append(command)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+
+def _plan_stages(plan) -> Iterator[dict]:
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def _winning_plans(explain) -> Iterator[dict]:
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                yield value
+            else:
+                yield from _winning_plans(value)
+    elif isinstance(explain, list):
+        for item in explain:
+            yield from _winning_plans(item)
+
+
+def plan_problems(explain: dict) -> List[str]:
+    """Returns the COLLSCAN / in-memory SORT stages found in an explain result."""
+    problems = []
+    for plan in _winning_plans(explain):
+        for stage in _plan_stages(plan):
+            if stage["stage"] == "COLLSCAN":
+                problems.append("COLLSCAN")
+            elif stage["stage"] == "SORT":
+                # Sorting on the text score is inherent to relevance ranking
+                if "$meta" not in str(stage.get("sortPattern", "")):
+                    problems.append(f"in-memory SORT on {stage.get('sortPattern')}")
+    for stage in explain.get("stages", []):
+        if "$sort" in stage:
+            problems.append(f"in-memory $sort on {stage['$sort'].get('sortKey')}")
+    return problems
+
+
+async def check_query_plans(database, commands: List[dict]) -> None:
+    """Explains each command and raises QueryPlanError listing every badly planned one."""
+    failures = []
+    for command in commands:
+        explain = await database.command({"explain": command, "verbosity": "queryPlanner"})
+        problems = plan_problems(explain)
+        if problems:
+            name = next(iter(command))
+            failures.append(f"{name} on '{command[name]}' {command}: {', '.join(problems)}")
+    if failures:
+        raise QueryPlanError("Queries without a usable index:\n" + "\n".join(failures))
+
+
+class QueryPlanMiddleware:
+    """
+    Explains the queries each request issued, including those run while a
+    streaming body is sent, and raises QueryPlanError once it has finished.
+    """
+
+    def __init__(self, app: ASGIApp, recorder: QueryRecorder, get_database: Callable):
+        self.app = app
+        self.recorder = recorder
+        self.get_database = get_database
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with self.recorder.recording() as commands:
+            await self.app(scope, receive, send)
+        await check_query_plans(self.get_database(), commands)
@@ -0,0 +1,82 @@
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Tuple, Type
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON-encode with orjson when it is installed, falling back to the standard library."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response that can encode raw BSON values (ObjectId, datetime) directly."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    Streaming response for endpoints that keep reading the request body while
+    they respond. StreamingResponse would otherwise listen for a client
+    disconnect on the same receive channel and swallow body chunks; a
+    disconnect still surfaces here through request.stream().
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+_schema_fields: Dict[Type[BaseModel], Tuple[Tuple[str, Any], ...]] = {}
+
+
+def _fields(schema: Type[BaseModel]) -> Tuple[Tuple[str, Any], ...]:
+    fields = _schema_fields.get(schema)
+    if fields is None:
+        fields = _schema_fields[schema] = tuple(
+            (name, None if field.is_required() else field.get_default(call_default_factory=True))
+            for name, field in schema.model_fields.items()
+        )
+    return fields
+
+
+def document_payload(raw: dict, schema: Type[BaseModel]) -> dict:
+    """
+    Shape a raw Mongo document like `schema` without validating it again.
+
+    Only for documents written through our own models, which were validated
+    on the way into the database. `_id` is exposed as `id`; fields the
+    schema doesn't declare are left out.
+    """
+    payload = {}
+    for field, default in _fields(schema):
+        if field == "id":
+            payload["id"] = raw["_id"]
+        else:
+            payload[field] = raw.get(field, default)
+    return payload
+
+
+def documents_payload(raws: Iterable[dict], schema: Type[BaseModel]) -> List[dict]:
+    return [document_payload(raw, schema) for raw in raws]
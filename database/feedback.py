@@ -1,26 +1,168 @@
-from typing import Union
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple, Union
 from beanie import PydanticObjectId
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
 
+from core.config import settings
+from database import feedback_stats
+from database.feedback_writer import feedback_writer
+from database.pagination import KEYSET_SORT, CountCache, keyset_cursor, keyset_filter
 from models.feedback import Feedback
 
+# Per-project feedback totals, cleared on inserts and deletes
+feedback_counts = CountCache(ttl=settings.COUNT_CACHE_TTL)
+
+
+async def _feedback_flushed(written: List[Feedback]) -> None:
+    feedback_counts.clear()
+    await feedback_stats.record_added(written)
+
+feedback_writer.on_flush(_feedback_flushed)
+
 
 async def add_feedback(feedback: Feedback) -> Feedback:
+    """Insert one feedback document, through the write-behind queue when it is running."""
+    if feedback_writer.running:
+        return await feedback_writer.submit(feedback)
     await feedback.insert()
+    feedback_counts.clear()
+    await feedback_stats.record_added([feedback])
     return feedback
 
 
+async def list_feedback(
+    project_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    raw: bool = False,
+) -> Tuple[List[Union[Feedback, dict]], Optional[str]]:
+    """
+    One page of a project's feedback, newest first, plus the cursor for the next page.
+    With `raw`, documents come back as the BSON dicts read from Mongo.
+    """
+    query = {"project_id": project_id}
+    if cursor:
+        query.update(keyset_filter(cursor))
+    find = Feedback.find(query).sort(*KEYSET_SORT).limit(limit + 1)
+    if raw:
+        feedback = await find.motor_cursor.to_list(length=None)
+    else:
+        feedback = await find.to_list()
+    next_cursor = None
+    if len(feedback) > limit:
+        feedback = feedback[:limit]
+        last = feedback[-1]
+        if raw:
+            next_cursor = keyset_cursor(last["created_at"], last["_id"])
+        else:
+            next_cursor = keyset_cursor(last.created_at, last.id)
+    return feedback, next_cursor
+
+
+async def iter_feedback_for_projects(project_ids: List[str], batch_size: int = 1000) -> AsyncIterator[dict]:
+    """
+    Raw feedback of several projects from one cursor, grouped by project_id
+    (ascending, which for ObjectId strings is _id order), newest first within
+    a project. At most `batch_size` documents are buffered at a time.
+    """
+    cursor = Feedback.get_motor_collection().find(
+        {"project_id": {"$in": project_ids}},
+        sort=[("project_id", 1), *KEYSET_SORT],
+        batch_size=batch_size,
+    )
+    async for doc in cursor:
+        yield doc
+
+
+async def count_feedback(project_id: str) -> int:
+    total = feedback_counts.get(project_id)
+    if total is None:
+        total = await Feedback.find({"project_id": project_id}).count()
+        feedback_counts.set(project_id, total)
+    return total
+
+
 async def delete_feedback(id: PydanticObjectId) -> bool:
-    feedback = await Feedback.get(id)
-    if feedback:
-        await feedback.delete()
+    deleted = await Feedback.get_motor_collection().find_one_and_delete({"_id": id})
+    if deleted:
+        feedback_counts.clear()
+        await feedback_stats.record_changes(deleted=[deleted])
         return True
     return False
 
 
 async def update_feedback_rank(id: PydanticObjectId, rank: int) -> Union[Feedback, None]:
-    feedback = await Feedback.get(id)
-    if feedback:
-        feedback.rank = rank
-        await feedback.save()
-        return feedback
-    return None
+    # The previous rank is needed to adjust the project's rank totals
+    before = await Feedback.get_motor_collection().find_one_and_update(
+        {"_id": id},
+        {"$set": {"rank": rank}},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
+        return None
+    await feedback_stats.record_changes(rank_changes=[(before, rank)])
+    return Feedback.model_validate({**before, "rank": rank})
+
+
+async def moderate_feedback(operations: List[dict]) -> List[dict]:
+    """
+    Apply a list of {"id", "action", "rank"} operations ("rank" or "delete"),
+    returning one result per operation, in order.
+
+    Each operation is its own find-and-modify, run with bounded concurrency,
+    so the stats are adjusted from the document the write actually changed:
+    an id deleted by someone else in the meantime is reported as not_found
+    and never counted twice.
+    """
+    results = [
+        {"id": op["id"], "action": op["action"], "status": "invalid", "detail": None}
+        for op in operations
+    ]
+    selected = {}
+    for index, op in enumerate(operations):
+        if not ObjectId.is_valid(op["id"]):
+            results[index]["detail"] = "Invalid feedback ID"
+        elif op["action"] == "rank" and op.get("rank") is None:
+            results[index]["detail"] = "rank is required"
+        elif ObjectId(op["id"]) in selected:
+            results[index]["detail"] = "Duplicate feedback ID"
+        else:
+            selected[ObjectId(op["id"])] = index
+
+    collection = Feedback.get_motor_collection()
+    semaphore = asyncio.Semaphore(settings.FEEDBACK_MODERATION_CONCURRENCY)
+    deleted, rank_changes = [], []
+
+    async def apply(id: ObjectId, index: int) -> None:
+        op = operations[index]
+        async with semaphore:
+            try:
+                if op["action"] == "delete":
+                    before = await collection.find_one_and_delete({"_id": id}, projection={"project_id": 1, "rank": 1})
+                else:
+                    before = await collection.find_one_and_update(
+                        {"_id": id},
+                        {"$set": {"rank": op["rank"]}},
+                        projection={"project_id": 1, "rank": 1},
+                        return_document=ReturnDocument.BEFORE,
+                    )
+            except PyMongoError as e:
+                results[index].update(status="error", detail=str(e))
+                return
+        if before is None:
+            results[index]["status"] = "not_found"
+        elif op["action"] == "delete":
+            results[index]["status"] = "deleted"
+            deleted.append(before)
+        else:
+            results[index]["status"] = "updated"
+            rank_changes.append((before, op["rank"]))
+
+    await asyncio.gather(*(apply(id, index) for id, index in selected.items()))
+    if deleted:
+        feedback_counts.clear()
+    if deleted or rank_changes:
+        await feedback_stats.record_changes(deleted=deleted, rank_changes=rank_changes)
+    return results
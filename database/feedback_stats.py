@@ -0,0 +1,177 @@
+"""
+Per-project feedback aggregates, stored on the project as `feedback_stats`.
+
+Feedback writes keep them current with single-document pipeline updates,
+so the numbers never need a scan of the feedback collection. If they drift
+(e.g. after manual edits in the database), rebuild them from scratch:
+
+    python -m database.feedback_stats
+
+A rebuild recomputes everything with one aggregation; feedback written
+while it runs may need another rebuild to be counted exactly.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo import DESCENDING, UpdateOne
+
+from models.feedback import Feedback
+from models.project import FeedbackStats, Project
+from database.versions import projects_version
+
+
+def _plus(field: str, delta: int) -> dict:
+    return {"$add": [{"$ifNull": [f"$feedback_stats.{field}", 0]}, delta]}
+
+
+def _stats_update(count: int = 0, ranked_count: int = 0, rank_sum: int = 0, latest_at=None, reset_latest: bool = False) -> list:
+    """Update pipeline applying the deltas and recomputing the average in the same atomic write."""
+    fields = {
+        "feedback_stats.count": _plus("count", count),
+        "feedback_stats.ranked_count": _plus("ranked_count", ranked_count),
+        "feedback_stats.rank_sum": _plus("rank_sum", rank_sum),
+    }
+    if reset_latest:
+        fields["feedback_stats.latest_at"] = {"$literal": latest_at}
+    elif latest_at is not None:
+        fields["feedback_stats.latest_at"] = {"$max": ["$feedback_stats.latest_at", latest_at]}
+    average = {
+        "$cond": [
+            {"$gt": ["$feedback_stats.ranked_count", 0]},
+            {"$divide": ["$feedback_stats.rank_sum", "$feedback_stats.ranked_count"]},
+            None,
+        ]
+    }
+    return [{"$set": fields}, {"$set": {"feedback_stats.rank_avg": average}}]
+
+
+def _project_id(project_id: str) -> Optional[ObjectId]:
+    return ObjectId(project_id) if ObjectId.is_valid(project_id) else None
+
+
+def _empty_delta() -> dict:
+    return {"count": 0, "ranked_count": 0, "rank_sum": 0, "latest_at": None}
+
+
+async def _latest_created_at(project_id: str):
+    # Read from the (project_id, created_at) index
+    latest = await Feedback.get_motor_collection().find_one(
+        {"project_id": project_id},
+        {"created_at": 1},
+        sort=[("created_at", DESCENDING), ("_id", DESCENDING)],
+    )
+    return latest["created_at"] if latest else None
+
+
+async def _write(deltas: Dict[str, dict], recompute_latest: Set[str] = frozenset()) -> None:
+    """One pipeline update per project; projects in `recompute_latest` get latest_at re-read."""
+    updates = []
+    for project_id, delta in deltas.items():
+        id = _project_id(project_id)
+        if id is None:
+            continue
+        if project_id in recompute_latest:
+            # The latest timestamp can't be decremented
+            delta = dict(delta, latest_at=await _latest_created_at(project_id), reset_latest=True)
+        elif not any((delta["count"], delta["ranked_count"], delta["rank_sum"], delta["latest_at"])):
+            continue
+        updates.append(UpdateOne({"_id": id}, _stats_update(**delta)))
+    if updates:
+        await Project.get_motor_collection().bulk_write(updates, ordered=False)
+        await projects_version.bump()
+
+
+async def record_added(feedback: Iterable[Feedback]) -> None:
+    """Count newly inserted feedback."""
+    deltas: Dict[str, dict] = defaultdict(_empty_delta)
+    for item in feedback:
+        delta = deltas[item.project_id]
+        delta["count"] += 1
+        if item.rank is not None:
+            delta["ranked_count"] += 1
+            delta["rank_sum"] += item.rank
+        if delta["latest_at"] is None or item.created_at > delta["latest_at"]:
+            delta["latest_at"] = item.created_at
+    await _write(deltas)
+
+
+async def record_changes(
+    deleted: Iterable[dict] = (),
+    rank_changes: Iterable[Tuple[dict, Optional[int]]] = (),
+) -> None:
+    """
+    Apply deletions and rank changes. Both take the raw feedback documents as
+    they were before the write; rank changes pair them with the new rank.
+    """
+    deltas: Dict[str, dict] = defaultdict(_empty_delta)
+    recompute_latest = set()
+    for doc in deleted:
+        delta = deltas[doc["project_id"]]
+        delta["count"] -= 1
+        if doc.get("rank") is not None:
+            delta["ranked_count"] -= 1
+            delta["rank_sum"] -= doc["rank"]
+        recompute_latest.add(doc["project_id"])
+    for doc, rank in rank_changes:
+        delta = deltas[doc["project_id"]]
+        old_rank = doc.get("rank")
+        delta["ranked_count"] += (rank is not None) - (old_rank is not None)
+        delta["rank_sum"] += (rank or 0) - (old_rank or 0)
+    await _write(deltas, recompute_latest)
+
+
+async def rebuild() -> int:
+    """Recompute every project's stats from the feedback collection. Returns the number of projects with feedback."""
+    pipeline = [
+        {
+            "$group": {
+                "_id": "$project_id",
+                "count": {"$sum": 1},
+                "ranked_count": {"$sum": {"$cond": [{"$isNumber": "$rank"}, 1, 0]}},
+                "rank_sum": {"$sum": "$rank"},
+                "latest_at": {"$max": "$created_at"},
+            }
+        },
+        {"$match": {"_id": {"$regex": "^[0-9a-fA-F]{24}$"}}},
+        {
+            "$project": {
+                "_id": {"$toObjectId": "$_id"},
+                "feedback_stats": {
+                    "count": "$count",
+                    "ranked_count": "$ranked_count",
+                    "rank_sum": "$rank_sum",
+                    "rank_avg": {
+                        "$cond": [{"$gt": ["$ranked_count", 0]}, {"$divide": ["$rank_sum", "$ranked_count"]}, None]
+                    },
+                    "latest_at": "$latest_at",
+                },
+            }
+        },
+        {"$merge": {"into": Project.get_collection_name(), "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}},
+    ]
+    await Feedback.get_motor_collection().aggregate(pipeline).to_list(length=None)
+
+    with_feedback = [id for project_id in await Feedback.distinct("project_id") if (id := _project_id(project_id))]
+    await Project.get_motor_collection().update_many(
+        {"_id": {"$nin": with_feedback}},
+        {"$set": {"feedback_stats": FeedbackStats().model_dump()}},
+    )
+    await projects_version.bump()
+    return len(with_feedback)
+
+
+async def main() -> None:
+    from core.database import close_db_connection, init_db
+
+    await init_db()
+    try:
+        projects = await rebuild()
+        print(f"Rebuilt feedback stats for {projects} projects with feedback")
+    finally:
+        await close_db_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
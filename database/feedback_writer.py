@@ -0,0 +1,179 @@
+"""
+Write-behind batching for feedback inserts.
+
+Submissions are queued in-process and written with one unordered
+insert_many per batch. A batch is flushed when it reaches
+FEEDBACK_BATCH_SIZE documents or FEEDBACK_BATCH_WINDOW seconds after its
+first document arrived, whichever comes first.
+
+With FEEDBACK_WAIT_FOR_WRITE the caller waits until its batch is
+acknowledged (fewer round trips, same durability as a plain insert).
+Without it the caller gets the generated id straight away and the write
+happens in the background; anything still queued is flushed on shutdown,
+but a crash loses at most one window of submissions.
+"""
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from beanie import PydanticObjectId
+from pymongo.errors import BulkWriteError
+
+from core.config import settings
+from models.feedback import Feedback
+
+Pending = Tuple[Feedback, Optional[asyncio.Future]]
+
+# Queued by stop() so the loop flushes what it has collected and exits
+_STOP = object()
+
+
+class FeedbackWriter:
+    def __init__(self, batch_size: int, window: float, wait_for_write: bool):
+        self.batch_size = batch_size
+        self.window = window
+        self.wait_for_write = wait_for_write
+        self._queue: "asyncio.Queue[Pending]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._listeners = []
+        # Metrics
+        self.batches = 0
+        self.inserted = 0
+        self.failed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def on_flush(self, callback) -> None:
+        """Register a callback run with the list of feedback written by each flush."""
+        self._listeners.append(callback)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.batches, 3) if self.batches else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 3),
+        }
+
+    async def submit(self, feedback: Feedback) -> Feedback:
+        """Queue one feedback document; its id is assigned here so it can be returned before the write."""
+        if feedback.id is None:
+            feedback.id = PydanticObjectId()
+        future = asyncio.get_running_loop().create_future() if self.wait_for_write else None
+        self._queue.put_nowait((feedback, future))
+        if future is not None:
+            await future
+        return feedback
+
+    async def _collect(self) -> Tuple[List[Pending], bool]:
+        """Next batch, and whether stop() was requested while collecting it."""
+        batch = []
+        item = await self._queue.get()
+        deadline = time.monotonic() + self.window
+        while item is not _STOP:
+            batch.append(item)
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.batch_size or remaining <= 0:
+                return batch, False
+            try:
+                item = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return batch, False
+        return batch, True
+
+    def _drain(self) -> List[Pending]:
+        batch = []
+        while not self._queue.empty() and len(batch) < self.batch_size:
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                batch.append(item)
+        return batch
+
+    async def _flush(self, batch: List[Pending]) -> None:
+        try:
+            written = await self._write(batch)
+        finally:
+            # Never leave a waiting submit() hanging, e.g. if the flush was cancelled
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(RuntimeError("Feedback batch was not written"))
+        if written:
+            for callback in self._listeners:
+                await callback(written)
+
+    async def _write(self, batch: List[Pending]) -> List[Feedback]:
+        """Insert the batch, settle each waiter's future and return the feedback that was written."""
+        started = time.perf_counter()
+        failures = {}
+        try:
+            await Feedback.insert_many([feedback for feedback, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            # Unordered: everything except the reported indexes was written
+            for error in e.details.get("writeErrors", []):
+                failures[error["index"]] = e
+        except Exception as e:
+            # PyMongoError, or anything else insert_many raised (e.g. encoding a document)
+            failures = {index: e for index in range(len(batch))}
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self._total_flush_ms += elapsed
+        self.failed += len(failures)
+        self.inserted += len(batch) - len(failures)
+        if failures:
+            print(f"Error writing feedback batch: {len(failures)} of {len(batch)} failed: {next(iter(failures.values()))}")
+
+        written = []
+        for index, (feedback, future) in enumerate(batch):
+            error = failures.get(index)
+            if error is None:
+                written.append(feedback)
+            if future is not None and not future.done():
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+        return written
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._collect()
+            if not batch:
+                continue
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                print(f"Error flushing feedback batch: {e}")
+
+    async def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush whatever is queued, then stop the background loop."""
+        if self._task is not None:
+            self._queue.put_nowait(_STOP)
+            await self._task
+            self._task = None
+        while not self._queue.empty():
+            batch = self._drain()
+            if batch:
+                await self._flush(batch)
+
+
+feedback_writer = FeedbackWriter(
+    batch_size=settings.FEEDBACK_BATCH_SIZE,
+    window=settings.FEEDBACK_BATCH_WINDOW,
+    wait_for_write=settings.FEEDBACK_WAIT_FOR_WRITE,
+)
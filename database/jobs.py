@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from beanie import PydanticObjectId
+from pymongo import ReturnDocument
+
+from models.job import Job
+
+
+async def enqueue_job(queue: str, name: str, payload: dict, run_at: Optional[datetime] = None, max_attempts: Optional[int] = None) -> Job:
+    job = Job(queue=queue, name=name, payload=payload)
+    if run_at is not None:
+        job.run_at = run_at
+    if max_attempts is not None:
+        job.max_attempts = max_attempts
+    return await job.insert()
+
+
+async def get_job(id: PydanticObjectId) -> Optional[Job]:
+    return await Job.get(id)
+
+
+async def claim_job(queue: str, worker: str, lease: float) -> Optional[Job]:
+    """Atomically take the oldest due job of `queue` and lease it to `worker`."""
+    now = datetime.utcnow()
+    doc = await Job.get_motor_collection().find_one_and_update(
+        {"queue": queue, "status": "queued", "run_at": {"$lte": now}},
+        {
+            "$set": {"status": "running", "worker": worker, "lease_until": now + timedelta(seconds=lease)},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+    return Job.model_validate(doc) if doc else None
+
+
+async def renew_lease(id: PydanticObjectId, worker: str, lease: float) -> bool:
+    """Extend a running job's lease. False if the job is no longer ours."""
+    result = await Job.get_motor_collection().update_one(
+        {"_id": id, "status": "running", "worker": worker},
+        {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=lease)}},
+    )
+    return result.matched_count == 1
+
+
+async def _finish(id: PydanticObjectId, worker: str, changes: dict) -> bool:
+    result = await Job.get_motor_collection().update_one(
+        {"_id": id, "status": "running", "worker": worker},
+        {"$set": {**changes, "worker": None, "lease_until": None}},
+    )
+    return result.matched_count == 1
+
+
+async def complete_job(id: PydanticObjectId, worker: str, result: Any) -> bool:
+    now = datetime.utcnow()
+    return await _finish(id, worker, {"status": "succeeded", "result": result, "error": None, "finished_at": now})
+
+
+async def fail_job(id: PydanticObjectId, worker: str, error: str, retry_at: Optional[datetime]) -> bool:
+    """Record a failed attempt: back to the queue at `retry_at`, or failed for good when it is None."""
+    if retry_at is None:
+        return await _finish(id, worker, {"status": "failed", "error": error, "finished_at": datetime.utcnow()})
+    return await _finish(id, worker, {"status": "queued", "error": error, "run_at": retry_at})
+
+
+async def requeue_expired_jobs() -> int:
+    """Put running jobs whose lease ran out (their worker died) back in the queue."""
+    result = await Job.get_motor_collection().update_many(
+        {"status": "running", "lease_until": {"$lt": datetime.utcnow()}},
+        {"$set": {"status": "queued", "worker": None, "lease_until": None, "run_at": datetime.utcnow()}},
+    )
+    return result.modified_count
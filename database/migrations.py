@@ -0,0 +1,57 @@
+"""
+Data fixes that have to run before init_beanie builds the declared indexes.
+
+Called from core.database.init_db with the raw motor database, since the
+Beanie models aren't initialised yet.
+"""
+from models.project import SEARCH_FIELDS, Project, search_tokens
+
+UNIQUE_BATCH_TOPIC_INDEX = "batch_topic_unique"
+# Non-unique index on the same keys that batch_topic_unique replaced
+_OLD_BATCH_TOPIC_INDEX = "batch_topic"
+
+
+async def _free_topic(collection, batch: str, topic: str) -> str:
+    for number in range(2, 10000):
+        candidate = f"{topic} ({number})"
+        if await collection.find_one({"batch": batch, "topic": candidate}, {"_id": 1}) is None:
+            return candidate
+    raise RuntimeError(f"No free topic name for {topic!r} in batch {batch!r}")
+
+
+async def ensure_unique_batch_topic(database) -> int:
+    """
+    Make (batch, topic) unique so batch_topic_unique can be built.
+
+    Drops the old non-unique index on the same keys (MongoDB refuses a second
+    index with the same key pattern) and renames all but the oldest project
+    of each duplicate group to "<topic> (2)", "<topic> (3)", ... Nothing is
+    deleted. Skipped once the unique index exists. Returns how many projects
+    were renamed.
+    """
+    collection = database[Project.Settings.name]
+    indexes = await collection.index_information()
+    if UNIQUE_BATCH_TOPIC_INDEX in indexes:
+        return 0
+    if _OLD_BATCH_TOPIC_INDEX in indexes:
+        await collection.drop_index(_OLD_BATCH_TOPIC_INDEX)
+
+    groups = collection.aggregate(
+        [
+            {"$sort": {"created_at": 1, "_id": 1}},
+            {"$group": {"_id": {"batch": "$batch", "topic": "$topic"}, "ids": {"$push": "$_id"}}},
+            {"$match": {"ids.1": {"$exists": True}}},
+        ],
+        allowDiskUse=True,
+    )
+    renamed = 0
+    async for group in groups:
+        batch, topic = group["_id"].get("batch"), group["_id"].get("topic")
+        for id in group["ids"][1:]:
+            new_topic = await _free_topic(collection, batch, topic)
+            doc = await collection.find_one({"_id": id}, {field: 1 for field in SEARCH_FIELDS})
+            doc["topic"] = new_topic
+            await collection.update_one({"_id": id}, {"$set": {"topic": new_topic, "search_tokens": search_tokens(doc)}})
+            print(f"Renamed duplicate project {id} in batch {batch!r}: {topic!r} -> {new_topic!r}")
+            renamed += 1
+    return renamed
@@ -0,0 +1,87 @@
+import base64
+import binascii
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Keyset order shared by every paginated listing: newest first, _id as tie-breaker
+KEYSET_SORT = [("created_at", -1), ("_id", -1)]
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor can't be decoded."""
+
+
+def encode_cursor(data: Dict[str, Any]) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidCursor("Invalid pagination cursor") from e
+    if not isinstance(data, dict):
+        raise InvalidCursor("Invalid pagination cursor")
+    return data
+
+
+def keyset_cursor(created_at: datetime, id: ObjectId) -> str:
+    """Opaque cursor pointing just after the given (created_at, _id) position."""
+    return encode_cursor({"c": created_at.isoformat(), "i": str(id)})
+
+
+def decode_keyset_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    data = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(data["c"]), ObjectId(data["i"])
+    except (KeyError, TypeError, ValueError, InvalidId) as e:
+        raise InvalidCursor("Invalid pagination cursor") from e
+
+
+def keyset_filter(cursor: str) -> dict:
+    """Mongo filter selecting the documents that come after `cursor` in KEYSET_SORT order."""
+    created_at, id = decode_keyset_cursor(cursor)
+    return {
+        "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": id}},
+        ]
+    }
+
+
+def offset_cursor(offset: int) -> str:
+    return encode_cursor({"o": offset})
+
+
+def decode_offset_cursor(cursor: str) -> int:
+    offset = decode_cursor(cursor).get("o")
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidCursor("Invalid pagination cursor")
+    return offset
+
+
+class CountCache:
+    """Small TTL cache for collection counts, so totals aren't recomputed per request."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[Hashable, Tuple[int, float]] = {}
+
+    def get(self, key: Hashable) -> Optional[int]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() >= entry[1]:
+            return None
+        return entry[0]
+
+    def set(self, key: Hashable, value: int) -> None:
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -1,8 +1,57 @@
-from typing import List, Optional
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, List, Literal, Optional, Tuple, Union
+from beanie import UpdateResponse
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
-from models.project import Project, ProjectUpdate
+from models.project import SEARCH_FIELDS, FeedbackStats, Project, ProjectCard, ProjectUpdate, search_tokens
+from core.config import settings
 from core.database import get_database
+from database.pagination import KEYSET_SORT, CountCache, keyset_cursor, keyset_filter
+from database.project_store import project_store
+from database.versions import projects_version
+
+# Totals for paginated listings, cleared on every project write
+project_counts = CountCache(ttl=settings.COUNT_CACHE_TTL)
+
+# Ids of projects recently seen visible, mapped to when that stops being trusted
+_visible_ids: "OrderedDict[ObjectId, float]" = OrderedDict()
+
+
+def _store_changed() -> None:
+    # Another worker (or this one) changed a project: totals and ETag version are stale
+    project_counts.clear()
+    _visible_ids.clear()
+    projects_version.invalidate()
+
+
+project_store.on_change(_store_changed)
+
+
+async def _projects_changed() -> None:
+    """Called after every project write: drops cached totals and bumps the collection version (ETags)."""
+    project_counts.clear()
+    _visible_ids.clear()
+    await projects_version.bump()
+
+
+async def projects_cache_version() -> Tuple[int, Optional[datetime]]:
+    """
+    (version, updated_at) for the ETags of public project reads. While the
+    project store serves reads, this is the version the store has caught up
+    to, so a new ETag is never sent with a body from before the change.
+    """
+    if project_store.ready:
+        return project_store.version, project_store.updated_at
+    return await projects_version.get()
+
+
+# "full" returns whole documents, "card" only the fields the gallery grid needs
+ProjectView = Literal["full", "card"]
 
 
 async def get_projects() -> List[Project]:
@@ -14,51 +63,321 @@ async def get_projects() -> List[Project]:
         raise
 
 
+def _listing_query(featured: bool) -> dict:
+    query = {"visibility": True}
+    if featured:
+        query["featured"] = True
+    return query
+
+
+async def list_projects(
+    featured: bool = False,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    view: ProjectView = "full",
+    raw: bool = False,
+) -> Tuple[List[Union[Project, ProjectCard, dict]], Optional[str]]:
+    """
+    One page of visible (optionally featured) projects, newest first.
+    Returns the page and the cursor for the next one, or None on the last page.
+    With `raw`, documents come back as the BSON dicts read from Mongo, or from
+    the in-memory project store when it is running.
+    """
+    if raw and project_store.ready:
+        return project_store.list(featured, limit, cursor)
+    query = _listing_query(featured)
+    if cursor:
+        query.update(keyset_filter(cursor))
+    find = Project.find(query).sort(*KEYSET_SORT).limit(limit + 1)
+    if view == "card":
+        find = find.project(ProjectCard)
+    if raw:
+        projects = await find.motor_cursor.to_list(length=None)
+    else:
+        projects = await find.to_list()
+    next_cursor = None
+    if len(projects) > limit:
+        projects = projects[:limit]
+        last = projects[-1]
+        if raw:
+            next_cursor = keyset_cursor(last["created_at"], last["_id"])
+        else:
+            next_cursor = keyset_cursor(last.created_at, last.id)
+    return projects, next_cursor
+
+
+async def count_projects(featured: bool = False) -> int:
+    if project_store.ready:
+        return project_store.count(featured)
+    key = ("listing", featured)
+    total = project_counts.get(key)
+    if total is None:
+        total = await Project.find(_listing_query(featured)).count()
+        project_counts.set(key, total)
+    return total
+
+
 async def get_project(id: ObjectId) -> Optional[Project]:
     return await Project.get(id)
 
 
+async def project_is_visible(id: ObjectId) -> bool:
+    """
+    Cheap existence + visibility check: answered from the project store or a
+    small TTL cache of known-visible ids, else with an id-only query.
+    """
+    if project_store.ready:
+        return project_store.get(id) is not None
+    expires_at = _visible_ids.get(id)
+    if expires_at is not None and time.monotonic() < expires_at:
+        return True
+    found = await Project.get_motor_collection().find_one({"_id": id, "visibility": True}, {"_id": 1})
+    if found is None:
+        _visible_ids.pop(id, None)
+        return False
+    _visible_ids[id] = time.monotonic() + settings.VISIBLE_ID_CACHE_TTL
+    _visible_ids.move_to_end(id)
+    while len(_visible_ids) > settings.VISIBLE_ID_CACHE_SIZE:
+        _visible_ids.popitem(last=False)
+    return True
+
+
+async def get_visible_project_raw(id: ObjectId) -> Optional[dict]:
+    if project_store.ready:
+        return project_store.get(id)
+    return await Project.get_motor_collection().find_one({"_id": id, "visibility": True})
+
+
 async def create_project(project: Project) -> Project:
-    return await project.insert()
+    project = await project.insert()
+    await _projects_changed()
+    return project
 
 
-async def update_project(id: ObjectId, project_update: ProjectUpdate) -> Optional[Project]:
-    project = await Project.get(id)
+async def _update_one(id: ObjectId, update: dict) -> Optional[Project]:
+    """
+    Apply `update` in a single find-one-and-update and return the updated
+    document. Edits to search fields are followed by a write of the
+    recomputed search_tokens.
+    """
+    project = await Project.find_one({"_id": id}).update(update, response_type=UpdateResponse.NEW_DOCUMENT)
     if project:
-        await project.update({"$set": project_update.dict(exclude_unset=True)})
-        return project
-    return None
+        if set(update.get("$set", {})) & set(SEARCH_FIELDS):
+            fields = project.model_dump(include=set(SEARCH_FIELDS))
+            project.search_tokens = search_tokens(fields)
+            # Only if the search fields still hold what the tokens were built from: a
+            # concurrent edit that changed them writes tokens from its newer document
+            await Project.get_motor_collection().update_one(
+                {"_id": id, **fields}, {"$set": {"search_tokens": project.search_tokens}}
+            )
+        await _projects_changed()
+    return project
+
+
+async def update_project(id: ObjectId, project_update: ProjectUpdate) -> Optional[Project]:
+    changes = project_update.dict(exclude_unset=True)
+    if not changes:
+        return await Project.get(id)
+    return await _update_one(id, {"$set": changes})
 
 
 async def delete_project(id: ObjectId) -> bool:
-    project = await Project.get(id)
-    if project:
-        await project.delete()
+    result = await Project.find_one({"_id": id}).delete()
+    if result and result.deleted_count:
+        await _projects_changed()
         return True
     return False
 
 
-async def search_projects(query: str) -> List[Project]:
-    projects = await Project.find(
+_SEARCH_WORD = re.compile(r"\w+")
+
+
+def _search_filter(query: str) -> Optional[dict]:
+    """
+    Filter for a search box query. Complete words go through the text index
+    (whole words and their stems); the last word, while still being typed
+    (no trailing space), is matched as a prefix of the indexed search_tokens,
+    so "dro" already finds "drone".
+    """
+    words = _SEARCH_WORD.findall(query.lower())
+    if not words:
+        return None
+    search = {"visibility": True}
+    if not query[-1].isspace():
+        search["search_tokens"] = {"$regex": "^" + re.escape(words.pop())}
+    if words:
+        search["$text"] = {"$search": " ".join(words)}
+    return search
+
+
+async def search_projects(
+    query: str,
+    limit: int = 20,
+    offset: int = 0,
+    view: ProjectView = "full",
+    raw: bool = False,
+) -> List[Union[Project, ProjectCard, dict]]:
+    """
+    Search over topic, description, search_tags, contributors and batch (see
+    _search_filter). Ranked by relevance when the query has complete words;
+    a lone partial word returns matches in search_tokens index order, i.e.
+    shortest completions first, without an in-memory sort.
+    """
+    search = _search_filter(query)
+    if search is None:
+        return []
+    find = Project.find(search)
+    if "$text" in search:
+        find = find.sort(("score", {"$meta": "textScore"}), ("created_at", -1))
+    find = find.skip(offset).limit(limit)
+    if view == "card":
+        find = find.project(ProjectCard)
+    if raw:
+        return await find.motor_cursor.to_list(length=None)
+    return await find.to_list()
+
+
+async def count_search_results(query: str) -> int:
+    key = ("search", query)
+    total = project_counts.get(key)
+    if total is None:
+        search = _search_filter(query)
+        total = await Project.find(search).count() if search is not None else 0
+        project_counts.set(key, total)
+    return total
+
+
+async def top_ranked_projects(limit: int = 10, min_ranked: int = 1) -> List[dict]:
+    """
+    Visible projects with the best average feedback rank, read from their
+    materialized stats. Rank 1 is best, so the lowest average comes first
+    (the rank_avg index walked backwards).
+    """
+    return await Project.get_motor_collection().find(
         {
-            "$and": [
-                {
-                    "$or": [
-                        {"topic": {"$regex": query, "$options": "i"}},
-                        {"description": {"$regex": query, "$options": "i"}}
-                    ]
-                },
-                {"visibility": True}
-            ]
-        }
-    ).to_list()
-    return projects
-
-
-async def set_featured_status(id: str, featured: bool) -> Optional[Project]:
-    project = await Project.get(ObjectId(id))
-    if project:
-        project.featured = featured
-        await project.save()
-        return project
-    return None
+            "visibility": True,
+            "feedback_stats.rank_avg": {"$ne": None},
+            "feedback_stats.ranked_count": {"$gte": min_ranked},
+        },
+        sort=[("feedback_stats.rank_avg", 1), ("_id", 1)],
+        limit=limit,
+    ).to_list(length=None)
+
+
+async def set_featured_status(id: ObjectId, featured: bool) -> Optional[Project]:
+    return await _update_one(id, {"$set": {"featured": featured}})
+
+
+async def bulk_update_projects(query: dict, changes: dict) -> Tuple[int, int]:
+    """$set `changes` on every project matching `query` with one update_many. Returns (matched, modified)."""
+    result = await Project.get_motor_collection().update_many(query, {"$set": changes})
+    if result.modified_count:
+        await _projects_changed()
+    return result.matched_count, result.modified_count
+
+
+# Project defaults that upsert_projects fills in on insert only
+_IMPORT_DEFAULTS = {
+    name: field.default for name, field in Project.model_fields.items() if name in ("visibility", "featured")
+}
+
+
+async def upsert_projects(docs: List[dict]) -> List[Tuple[str, Optional[ObjectId], Optional[str]]]:
+    """
+    Idempotent batch write keyed on (topic, batch), unique in the collection:
+    new projects are inserted, existing ones get only the given fields
+    replaced, so `docs` should hold just the fields that were set. One
+    unordered bulk_write.
+    Returns (status, id, error) per document, status being "created", "updated" or "error".
+    """
+    now = datetime.utcnow()
+    requests = []
+    for doc in docs:
+        # Defaults only apply to new projects: re-importing a line that omits
+        # visibility/featured must not unhide or re-feature an existing one
+        on_insert = {"created_at": now, "feedback_stats": FeedbackStats().model_dump()}
+        on_insert.update({field: value for field, value in _IMPORT_DEFAULTS.items() if field not in doc})
+        requests.append(UpdateOne(
+            {"topic": doc["topic"], "batch": doc["batch"]},
+            {"$set": {**doc, "search_tokens": search_tokens(doc)}, "$setOnInsert": on_insert},
+            upsert=True,
+        ))
+    collection = Project.get_motor_collection()
+    errors = {}
+    try:
+        upserted = (await collection.bulk_write(requests, ordered=False)).upserted_ids
+    except BulkWriteError as e:
+        errors = {error["index"]: error.get("errmsg") for error in e.details.get("writeErrors", [])}
+        upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+
+    # Updated documents don't report their ids; look them up in one query
+    updated_keys = {
+        (doc["topic"], doc["batch"])
+        for index, doc in enumerate(docs)
+        if index not in errors and index not in upserted
+    }
+    existing = {}
+    if updated_keys:
+        cursor = collection.find(
+            {"$or": [{"topic": topic, "batch": batch} for topic, batch in updated_keys]},
+            {"topic": 1, "batch": 1},
+        )
+        async for doc in cursor:
+            existing[(doc["topic"], doc["batch"])] = doc["_id"]
+
+    if len(errors) < len(docs):
+        await _projects_changed()
+    results = []
+    for index, doc in enumerate(docs):
+        if index in errors:
+            results.append(("error", None, errors[index]))
+        elif index in upserted:
+            results.append(("created", upserted[index], None))
+        else:
+            results.append(("updated", existing.get((doc["topic"], doc["batch"])), None))
+    return results
+
+
+async def iter_projects(
+    query: dict,
+    after: Optional[ObjectId] = None,
+    batch_size: int = 1000,
+    projection: Optional[dict] = None,
+) -> AsyncIterator[dict]:
+    """
+    Raw projects matching `query` in _id order, streamed from the cursor `batch_size`
+    documents per round trip. `after` resumes just past a previously seen _id.
+    """
+    if after is not None:
+        query = {**query, "_id": {"$gt": after}}
+    cursor = Project.get_motor_collection().find(query, projection, sort=[("_id", 1)], batch_size=batch_size)
+    async for doc in cursor:
+        yield doc
+
+
+async def set_dimensions(sizes: List[Tuple[ObjectId, int, int]]) -> int:
+    """Store (id, width, height) corrections with one unordered bulk_write. Returns the number modified."""
+    result = await Project.get_motor_collection().bulk_write(
+        [UpdateOne({"_id": id}, {"$set": {"width": width, "height": height}}) for id, width, height in sizes],
+        ordered=False,
+    )
+    if result.modified_count:
+        await _projects_changed()
+    return result.modified_count
+
+
+async def reindex_search_tokens(batch_size: int = 500) -> int:
+    """Recompute search_tokens on every project (projects written before they existed). Returns the number modified."""
+    modified = 0
+    requests = []
+    projection = {field: 1 for field in SEARCH_FIELDS}
+    async for doc in iter_projects({}, batch_size=batch_size, projection=projection):
+        requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"search_tokens": search_tokens(doc)}}))
+        if len(requests) >= batch_size:
+            modified += (await Project.get_motor_collection().bulk_write(requests, ordered=False)).modified_count
+            requests = []
+    if requests:
+        modified += (await Project.get_motor_collection().bulk_write(requests, ordered=False)).modified_count
+    if modified:
+        await _projects_changed()
+    return modified
@@ -0,0 +1,223 @@
+"""
+In-process materialized copy of the visible projects.
+
+Each worker loads the visible projects at startup and then follows a
+change stream over the `projects` collection and the projects version
+counter, so every worker converges on the same data without extra
+invalidation messages. Writers bump the counter after their write, so by
+the time the store sees a bump it has applied the changes before it;
+`version` is therefore safe to build ETags from while the store serves reads. On a transient error the
+stream is resumed from the last resume token; if the oplog has moved past
+that token, the store re-bootstraps from a fresh snapshot.
+
+Change streams need a replica set. For local testing a single-node one is enough:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0
+    mongosh --eval 'rs.initiate()'
+
+Without a replica set the store disables itself and reads go to Mongo.
+"""
+import asyncio
+import bisect
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from core.database import get_database
+from database.pagination import decode_keyset_cursor, keyset_cursor
+from database.versions import COLLECTION as VERSIONS_COLLECTION, projects_version
+from models.project import Project
+
+# Server error codes
+CHANGE_STREAM_FATAL_ERROR = 280
+CHANGE_STREAM_HISTORY_LOST = 286
+NOT_A_REPLICA_SET = 40573
+
+RETRY_DELAY = 5
+
+SortKey = Tuple[datetime, ObjectId]
+
+
+def _sort_key(doc: dict) -> SortKey:
+    # Missing created_at sorts first, as null does in Mongo
+    return doc.get("created_at") or datetime.min, doc["_id"]
+
+
+class ProjectStore:
+    def __init__(self):
+        self.ready = False
+        self.disabled = False
+        self._docs: Dict[ObjectId, dict] = {}
+        # Ascending by (created_at, _id); listings walk it backwards
+        self._keys: List[SortKey] = []
+        self._ordered: List[dict] = []
+        # projects_version as of the last applied change, with its updated_at
+        self.version = 0
+        self.updated_at: Optional[datetime] = None
+        self._resume_token = None
+        self._task: Optional[asyncio.Task] = None
+        self._listeners = []
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def on_change(self, callback) -> None:
+        """Register a callback run after every applied change (e.g. cache invalidation)."""
+        self._listeners.append(callback)
+
+    # --- Reads ---
+
+    def get(self, id: ObjectId) -> Optional[dict]:
+        return self._docs.get(id)
+
+    def list(self, featured: bool = False, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Same contract as database.project.list_projects(raw=True)."""
+        start = len(self._keys)
+        if cursor:
+            start = bisect.bisect_left(self._keys, decode_keyset_cursor(cursor))
+
+        page = []
+        next_cursor = None
+        for index in range(start - 1, -1, -1):
+            doc = self._ordered[index]
+            if featured and not doc.get("featured", True):
+                continue
+            if len(page) == limit:
+                last = page[-1]
+                next_cursor = keyset_cursor(last["created_at"], last["_id"])
+                break
+            page.append(doc)
+        return page, next_cursor
+
+    def all(self, featured: bool = False) -> List[dict]:
+        docs = reversed(self._ordered)
+        if featured:
+            return [doc for doc in docs if doc.get("featured", True)]
+        return list(docs)
+
+    def count(self, featured: bool = False) -> int:
+        if not featured:
+            return len(self._docs)
+        return sum(1 for doc in self._ordered if doc.get("featured", True))
+
+    # --- Maintenance ---
+
+    def _remove(self, id: ObjectId) -> None:
+        doc = self._docs.pop(id, None)
+        if doc is None:
+            return
+        index = bisect.bisect_left(self._keys, _sort_key(doc))
+        del self._keys[index]
+        del self._ordered[index]
+
+    def _upsert(self, doc: dict) -> None:
+        self._remove(doc["_id"])
+        if not doc.get("visibility", True):
+            return
+        key = _sort_key(doc)
+        index = bisect.bisect_left(self._keys, key)
+        self._keys.insert(index, key)
+        self._ordered.insert(index, doc)
+        self._docs[doc["_id"]] = doc
+
+    def _set_version(self, doc: Optional[dict]) -> None:
+        if doc:
+            self.version = doc.get("version", 0)
+            self.updated_at = doc.get("updated_at")
+
+    def _apply(self, change: dict) -> bool:
+        """Apply one change event. Returns False when the store must be re-bootstrapped."""
+        operation = change["operationType"]
+        if change.get("ns", {}).get("coll") == VERSIONS_COLLECTION:
+            if operation in ("insert", "replace", "update"):
+                self._set_version(change.get("fullDocument"))
+                for callback in self._listeners:
+                    callback()
+                return True
+            return operation not in ("drop", "rename", "invalidate")
+        if operation in ("insert", "replace", "update"):
+            doc = change.get("fullDocument")
+            if doc is None:
+                # Deleted again before the update lookup ran
+                self._remove(change["documentKey"]["_id"])
+            else:
+                self._upsert(doc)
+        elif operation == "delete":
+            self._remove(change["documentKey"]["_id"])
+        elif operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            return False
+        for callback in self._listeners:
+            callback()
+        return True
+
+    async def _bootstrap(self, collection) -> None:
+        # Version first: the snapshot is then at least as new as the ETags built from it
+        self._set_version(await get_database()[VERSIONS_COLLECTION].find_one({"_id": projects_version.name}))
+        docs = await collection.find({"visibility": True}).to_list(length=None)
+        docs.sort(key=_sort_key)
+        self._docs = {doc["_id"]: doc for doc in docs}
+        self._keys = [_sort_key(doc) for doc in docs]
+        self._ordered = docs
+        self.ready = True
+        for callback in self._listeners:
+            callback()
+
+    async def _follow(self) -> None:
+        collection = Project.get_motor_collection()
+        pipeline = [{"$match": {"$or": [
+            {"ns.coll": collection.name},
+            {"ns.coll": VERSIONS_COLLECTION, "documentKey._id": projects_version.name},
+        ]}}]
+        while True:
+            try:
+                bootstrap = self._resume_token is None
+                async with get_database().watch(pipeline, full_document="updateLookup", resume_after=self._resume_token) as stream:
+                    if bootstrap:
+                        # Stream is open before the snapshot, so nothing in between is missed
+                        self._resume_token = stream.resume_token
+                        await self._bootstrap(collection)
+                    async for change in stream:
+                        if not self._apply(change):
+                            self._resume_token = None
+                            break
+                        self._resume_token = stream.resume_token
+            except OperationFailure as e:
+                if e.code == NOT_A_REPLICA_SET:
+                    print("Project store disabled: change streams need a replica set")
+                    self.ready = False
+                    self.disabled = True
+                    return
+                if e.code in (CHANGE_STREAM_HISTORY_LOST, CHANGE_STREAM_FATAL_ERROR):
+                    print(f"Project store fell behind the oplog, re-bootstrapping: {e}")
+                    self._resume_token = None
+                else:
+                    print(f"Project store change stream error: {e}")
+                    await asyncio.sleep(RETRY_DELAY)
+            except PyMongoError as e:
+                print(f"Project store change stream error: {e}")
+                await asyncio.sleep(RETRY_DELAY)
+            except Exception as e:
+                # E.g. a malformed document; stop serving reads rather than a frozen snapshot
+                print(f"Error in project store, re-bootstrapping: {e}")
+                self.ready = False
+                self._resume_token = None
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._follow())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.ready = False
+
+
+project_store = ProjectStore()
@@ -0,0 +1,55 @@
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from core.config import settings
+from core.database import get_database
+
+COLLECTION = "collection_versions"
+
+
+class VersionCounter:
+    """
+    Monotonic version number for a collection, stored in Mongo so every worker
+    agrees on it. Writers bump it; readers use it to build ETags. Reads are
+    cached in-process for `ttl` seconds so conditional requests don't hit Mongo.
+    """
+
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self._version = 0
+        self._updated_at: Optional[datetime] = None
+        self._read_at = float("-inf")
+
+    def _remember(self, doc: Optional[dict]) -> Tuple[int, Optional[datetime]]:
+        if doc:
+            self._version = doc.get("version", 0)
+            self._updated_at = doc.get("updated_at")
+        self._read_at = time.monotonic()
+        return self._version, self._updated_at
+
+    async def get(self) -> Tuple[int, Optional[datetime]]:
+        """Current (version, updated_at)."""
+        if time.monotonic() - self._read_at < self.ttl:
+            return self._version, self._updated_at
+        doc = await get_database()[COLLECTION].find_one({"_id": self.name})
+        return self._remember(doc)
+
+    def invalidate(self) -> None:
+        """Forget the cached value so the next get() reads it again."""
+        self._read_at = float("-inf")
+
+    async def bump(self) -> int:
+        doc = await get_database()[COLLECTION].find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return self._remember(doc)[0]
+
+
+projects_version = VersionCounter("projects", ttl=settings.VERSION_CACHE_TTL)
@@ -3,6 +3,7 @@ from typing import Optional
 
 from beanie import Document
 from pydantic import Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
 
 class Feedback(Document):
@@ -14,3 +15,9 @@ class Feedback(Document):
 
     class Settings:
         name = "feedback"
+        indexes = [
+            IndexModel(
+                [("project_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="project_id_created_at_id",
+            ),
+        ]
@@ -0,0 +1,43 @@
+from datetime import datetime
+from typing import Any, Literal, Optional
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+
+from core.config import settings
+
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+
+class Job(Document):
+    queue: str
+    name: str
+    payload: dict = Field(default_factory=dict)
+    status: JobStatus = "queued"
+    attempts: int = 0
+    max_attempts: int = settings.JOB_MAX_ATTEMPTS
+    # Not claimable before this (delayed jobs, retry backoff)
+    run_at: datetime = Field(default_factory=datetime.utcnow)
+    # While running: the claiming worker and how long its claim is valid
+    worker: Optional[str] = None
+    lease_until: Optional[datetime] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+    class Settings:
+        name = "jobs"
+        indexes = [
+            # Claiming: oldest due job of a queue
+            IndexModel([("queue", ASCENDING), ("status", ASCENDING), ("run_at", ASCENDING)], name="queue_status_run_at"),
+            # Requeueing jobs whose worker stopped renewing its lease
+            IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease_until"),
+            # Finished jobs are removed after the retention period
+            IndexModel(
+                [("finished_at", ASCENDING)],
+                name="finished_at_ttl",
+                expireAfterSeconds=settings.JOB_RETENTION_SECONDS,
+            ),
+        ]
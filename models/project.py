@@ -1,8 +1,34 @@
+import re
 from datetime import datetime
 from typing import List, Optional
 
-from beanie import Document
+from beanie import Document, Insert, PydanticObjectId, Replace, SaveChanges, before_event
 from pydantic import BaseModel, Field
+from pymongo import ASCENDING, DESCENDING, IndexModel, TEXT
+
+# Fields covered by project search (the text index and search_tokens)
+SEARCH_FIELDS = ("topic", "description", "search_tags", "contributors", "batch")
+
+_WORD = re.compile(r"\w+")
+
+
+def search_tokens(doc: dict) -> List[str]:
+    """Distinct lowercased words of the search fields, matched by prefix for search-as-you-type."""
+    words = set()
+    for field in SEARCH_FIELDS:
+        value = doc.get(field) or ""
+        for text in value if isinstance(value, list) else [value]:
+            words.update(_WORD.findall(text.lower()))
+    return sorted(words)
+
+
+class FeedbackStats(BaseModel):
+    """Feedback aggregates kept on each project by database.feedback_stats."""
+    count: int = 0
+    ranked_count: int = 0
+    rank_sum: int = 0
+    rank_avg: Optional[float] = None
+    latest_at: Optional[datetime] = None
 
 
 class Project(Document):
@@ -18,13 +44,50 @@ class Project(Document):
     visibility: bool = True
     featured: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    feedback_stats: FeedbackStats = Field(default_factory=FeedbackStats)
+    search_tokens: List[str] = Field(default_factory=list)
 
     def __repr__(self) -> str:
         return f"<Project {self.topic}>"
 
+    @before_event(Insert, Replace, SaveChanges)
+    def _index_search_tokens(self) -> None:
+        self.search_tokens = search_tokens({field: getattr(self, field) for field in SEARCH_FIELDS})
+
     class Settings:
         name = "projects"
         use_state_management = True
+        indexes = [
+            IndexModel(
+                [("visibility", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="visibility_created_at_id",
+            ),
+            IndexModel(
+                [("featured", ASCENDING), ("visibility", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="featured_visibility_created_at_id",
+            ),
+            IndexModel(
+                [("visibility", ASCENDING), ("feedback_stats.rank_avg", DESCENDING), ("_id", DESCENDING)],
+                name="visibility_feedback_rank_avg_id",
+            ),
+            # Natural key used by the bulk import's upserts; unique so concurrent imports can't duplicate a line
+            IndexModel([("batch", ASCENDING), ("topic", ASCENDING)], name="batch_topic_unique", unique=True),
+            # Prefix matching of the word being typed in database.project.search_projects
+            IndexModel([("search_tokens", ASCENDING), ("visibility", ASCENDING)], name="search_tokens_visibility"),
+            # Covers the id-only visibility check in database.project.project_is_visible
+            IndexModel([("_id", ASCENDING), ("visibility", ASCENDING)], name="id_visibility"),
+            IndexModel(
+                [
+                    ("topic", TEXT),
+                    ("description", TEXT),
+                    ("search_tags", TEXT),
+                    ("contributors", TEXT),
+                    ("batch", TEXT),
+                ],
+                weights={"topic": 10, "search_tags": 5, "contributors": 3, "batch": 3, "description": 1},
+                name="project_text_search",
+            ),
+        ]
 
     async def save_with_timestamp(self) -> None:
         self.updated_at = datetime.utcnow()
@@ -32,11 +95,31 @@ class Project(Document):
 
     @classmethod
     async def get_visible_projects(cls) -> List["Project"]:
-        return await cls.find({"visibility": True}).to_list()
+        from database.project_store import project_store
+        if project_store.ready:
+            return [cls.model_validate(doc) for doc in project_store.all()]
+        return await cls.find({"visibility": True}).sort("-created_at").to_list()
 
     @classmethod
     async def get_featured_projects(cls) -> List["Project"]:
-        return await cls.find({"featured": True, "visibility": True}).to_list()
+        from database.project_store import project_store
+        if project_store.ready:
+            return [cls.model_validate(doc) for doc in project_store.all(featured=True)]
+        return await cls.find({"featured": True, "visibility": True}).sort("-created_at").to_list()
+
+
+class ProjectCard(BaseModel):
+    """
+    Projection of `Project` with just what the gallery grid renders.
+    Fetched with a server-side projection, so the long text fields never leave Mongo.
+    """
+    id: PydanticObjectId = Field(alias="_id")
+    topic: str
+    batch: str
+    image: str
+    width: int
+    height: int
+    created_at: datetime
 
 
 class ProjectUpdate(BaseModel):
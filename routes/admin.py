@@ -1,5 +1,11 @@
-from fastapi import APIRouter, Depends
+from beanie import PydanticObjectId
+from fastapi import APIRouter, Depends, HTTPException
 from auth.jwt_bearer import JWTBearer
+from bson import ObjectId
+from database import jobs as jobs_db
+from database.feedback_writer import feedback_writer
+from schemas.job import JobSchema, ProbeDimensionsRequest
+from services.jobs import enqueue
 
 router = APIRouter()
 
@@ -8,4 +14,39 @@ async def admin_dashboard():
     """
     Admin dashboard endpoint, accessible only to users with the 'admin' role in Keycloak.
     """
-    return {"message": "Welcome to the admin dashboard!"}
\ No newline at end of file
+    return {"message": "Welcome to the admin dashboard!"}
+
+@router.get("/feedback-writer", dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
+async def feedback_writer_stats():
+    """
+    Queue depth and flush latency of the feedback write-behind queue.
+    """
+    return {"running": feedback_writer.running, **feedback_writer.stats()}
+
+
+# --- Background jobs ---
+# Enqueueing returns 202 with the job; poll GET /admin/jobs/{jobId} for its status and result.
+
+@router.post("/jobs/probe-dimensions", response_model=JobSchema, status_code=202, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
+async def enqueue_probe_dimensions(request: ProbeDimensionsRequest):
+    if not all(ObjectId.is_valid(id) for id in request.project_ids):
+        raise HTTPException(status_code=400, detail="Invalid project ID")
+    return await enqueue("probe_dimensions", request.dict())
+
+@router.post("/jobs/rebuild-feedback-stats", response_model=JobSchema, status_code=202, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
+async def enqueue_rebuild_feedback_stats():
+    return await enqueue("rebuild_feedback_stats")
+
+@router.post("/jobs/reindex-search", response_model=JobSchema, status_code=202, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
+async def enqueue_reindex_search():
+    """Fill in search_tokens (prefix search) on projects stored before they existed."""
+    return await enqueue("reindex_search_tokens")
+
+@router.get("/jobs/{jobId}", response_model=JobSchema, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
+async def get_job_status(jobId: str):
+    if not ObjectId.is_valid(jobId):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    job = await jobs_db.get_job(PydanticObjectId(jobId))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -1,49 +1,225 @@
-from fastapi import APIRouter, HTTPException, Query, Body, Depends, Response, status
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, Body, Depends, Request, Response, status
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Tuple, Union
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 from auth.jwt_bearer import JWTBearer
+from core.config import settings
+from core.http_cache import cache_headers, make_etag, not_modified
+from core.serialization import FastJSONResponse, RequestStreamingResponse, document_payload, documents_payload, dumps
 from models.feedback import Feedback
 from models.project import Project, ProjectUpdate
-from schemas.feedback import FeedbackCreate, FeedbackResponse, FeedbackUpdate
-from schemas.project import ProjectSchema, ProjectUpdateSchema, ProjectCreateSchema, ProjectListSchema
+from schemas.feedback import FeedbackBulkRequest, FeedbackBulkResponse, FeedbackCreate, FeedbackResponse, FeedbackUpdate
+from schemas.project import (
+    ProjectBulkUpdateResponse,
+    ProjectBulkUpdateSchema,
+    ProjectCardListSchema,
+    ProjectCardSchema,
+    ProjectCreateSchema,
+    ProjectListSchema,
+    ProjectSchema,
+    ProjectUpdateSchema,
+)
+from database import feedback as feedback_db
 from database import project as project_db
+from database.project import ProjectView
+from database.pagination import InvalidCursor, decode_offset_cursor, offset_cursor
+from services.jobs import enqueue
+from services.project_export import MEDIA_TYPES, ExportFormat, export_projects
+from services.project_import import import_projects
 
 router = APIRouter()
 
+PageSize = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE)
+
+
+def _page_headers(next_cursor: Optional[str], total: Optional[int]) -> dict:
+    """Pagination metadata for endpoints that return a bare list."""
+    headers = {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        headers["X-Total-Count"] = str(total)
+    return headers
+
+
+async def _public_cache(request: Request) -> Tuple[Optional[Response], dict]:
+    """
+    Cache headers for public project reads, derived from the projects collection
+    version. The first item is a ready 304 response when the client's copy is current.
+    """
+    version, updated_at = await project_db.projects_cache_version()
+    headers = cache_headers(make_etag("projects", version), updated_at)
+    return not_modified(request, headers, updated_at), headers
+
+
+async def _probe_dimensions_later(project_id: ObjectId) -> None:
+    """Queue a background check of the project's stored image size (the client-sent one is often wrong)."""
+    if not settings.JOB_PROBE_ON_WRITE:
+        return
+    try:
+        await enqueue("probe_dimensions", {"project_ids": [str(project_id)]})
+    except Exception as e:
+        print(f"Error queueing dimension probe for {project_id}: {e}")
+
+
+# Read endpoints build their payloads straight from the raw documents and
+# return a FastJSONResponse, skipping the response_model validation pass.
+# response_model is kept for the OpenAPI schema.
+
 # --- Public Routes ---
 
-@router.get("/all", response_model=ProjectListSchema)
-async def list_projects(featured: bool = False):
+@router.get("/all", response_model=Union[ProjectListSchema, ProjectCardListSchema])
+async def list_projects(
+    request: Request,
+    featured: bool = False,
+    limit: int = PageSize,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    view: ProjectView = "full",
+):
+    cached, headers = await _public_cache(request)
+    if cached:
+        return cached
     try:
-        if featured:
-            projects = await Project.get_featured_projects()
-        else:
-            projects = await Project.get_visible_projects()
-        return ProjectListSchema(projects=projects)
+        projects, next_cursor = await project_db.list_projects(featured, limit, cursor, view, raw=True)
+        total = await project_db.count_projects(featured) if include_total else None
+        item_schema = ProjectCardSchema if view == "card" else ProjectSchema
+        return FastJSONResponse({
+            "projects": documents_payload(projects, item_schema),
+            "next_cursor": next_cursor,
+            "total": total,
+        }, headers=headers)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/search/", response_model=List[ProjectSchema])
-async def search_projects_by_query(query: str):
-    return await project_db.search_projects(query)
+@router.get("/search/", response_model=Union[List[ProjectSchema], List[ProjectCardSchema]])
+async def search_projects_by_query(
+    request: Request,
+    query: str,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    view: ProjectView = "full",
+):
+    cached, headers = await _public_cache(request)
+    if cached:
+        return cached
+    # Results are ranked by relevance, so the cursor carries the offset of the next page
+    if cursor:
+        try:
+            offset = decode_offset_cursor(cursor)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    projects = await project_db.search_projects(query, limit=limit + 1, offset=offset, view=view, raw=True)
+    next_cursor = offset_cursor(offset + limit) if len(projects) > limit else None
+    total = await project_db.count_search_results(query) if include_total else None
+    item_schema = ProjectCardSchema if view == "card" else ProjectSchema
+    return FastJSONResponse(
+        documents_payload(projects[:limit], item_schema),
+        headers={**headers, **_page_headers(next_cursor, total)},
+    )
+
+@router.get("/feedback/top", response_model=List[ProjectSchema])
+async def top_ranked_projects(
+    request: Request,
+    limit: int = Query(10, ge=1, le=100),
+    min_ranked: int = Query(1, ge=1),
+):
+    """Visible projects with the best (lowest) average feedback rank first."""
+    cached, headers = await _public_cache(request)
+    if cached:
+        return cached
+    projects = await project_db.top_ranked_projects(limit, min_ranked)
+    return FastJSONResponse(documents_payload(projects, ProjectSchema), headers=headers)
+
+@router.get("/export", dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
+async def export_projects_stream(
+    format: ExportFormat = "ndjson",
+    include_feedback: bool = False,
+    after: Optional[str] = Query(None, description="Resume after this project id (the last one received)"),
+    batch: Optional[str] = None,
+    visibility: Optional[bool] = None,
+    featured: Optional[bool] = None,
+):
+    """Stream every matching project, in _id order, as NDJSON or CSV."""
+    if after is not None and not ObjectId.is_valid(after):
+        raise HTTPException(status_code=400, detail="Invalid project ID in after")
+    query = {
+        field: value
+        for field, value in (("batch", batch), ("visibility", visibility), ("featured", featured))
+        if value is not None
+    }
+    chunks = export_projects(
+        query,
+        format,
+        include_feedback,
+        ObjectId(after) if after else None,
+        settings.EXPORT_BATCH_SIZE,
+    )
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="projects.{format}"'},
+    )
 
 @router.get("/{projectId}", response_model=ProjectSchema)
-async def get_project_by_id(projectId: str):
+async def get_project_by_id(request: Request, projectId: str):
     if not ObjectId.is_valid(projectId):
         raise HTTPException(status_code=400, detail="Invalid project ID")
-    project = await project_db.get_project(ObjectId(projectId))
-    if not project or not project.visibility:
+    cached, headers = await _public_cache(request)
+    if cached:
+        return cached
+    project = await project_db.get_visible_project_raw(ObjectId(projectId))
+    if not project:
         raise HTTPException(status_code=404, detail="Project not found or not visible")
-    return project
+    return FastJSONResponse(document_payload(project, ProjectSchema), headers=headers)
 
 # --- Protected Routes ---
 
 @router.post("/create", response_model=ProjectSchema, status_code=201, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
 async def create_new_project(project: ProjectCreateSchema):
-    new_project = Project(**project.dict())
-    return await project_db.create_project(new_project)
+    try:
+        new_project = await project_db.create_project(Project(**project.dict()))
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="A project with this topic already exists in the batch")
+    await _probe_dimensions_later(new_project.id)
+    return new_project
+
+@router.post("/bulk", response_model=ProjectBulkUpdateResponse, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
+async def bulk_update_projects(update: ProjectBulkUpdateSchema):
+    changes = update.dict(include={"visibility", "featured"}, exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to update: set visibility and/or featured")
+    if (update.ids is None) == (update.filter is None):
+        raise HTTPException(status_code=400, detail="Select projects with exactly one of ids or filter")
+    if update.ids is not None:
+        if not all(ObjectId.is_valid(id) for id in update.ids):
+            raise HTTPException(status_code=400, detail="Invalid project ID")
+        query = {"_id": {"$in": [ObjectId(id) for id in update.ids]}}
+    else:
+        query = update.filter.dict(exclude_none=True)
+        if not query:
+            raise HTTPException(status_code=400, detail="Filter needs at least one field")
+    matched, modified = await project_db.bulk_update_projects(query, changes)
+    return ProjectBulkUpdateResponse(matched=matched, modified=modified)
+
+@router.post("/import", dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
+async def import_projects_ndjson(request: Request, batch_size: int = Query(settings.IMPORT_BATCH_SIZE, ge=1, le=5000)):
+    """
+    Upsert projects from an NDJSON body (one ProjectCreateSchema per line), keyed on
+    (topic, batch). Streams back one NDJSON result per line, then a summary line.
+    """
+    async def results():
+        async for result in import_projects(request.stream(), batch_size):
+            yield dumps(result) + b"\n"
+
+    return RequestStreamingResponse(results(), media_type="application/x-ndjson")
 
 @router.put("/{projectId}", response_model=ProjectSchema, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
 async def update_existing_project(projectId: str, project_update: ProjectUpdateSchema):
@@ -52,10 +228,15 @@ async def update_existing_project(projectId: str, project_update: ProjectUpdateS
     
     # Using ProjectUpdate model as it aligns with the database function
     update_data = ProjectUpdate(**project_update.dict(exclude_unset=True))
-    updated_project = await project_db.update_project(ObjectId(projectId), update_data)
+    try:
+        updated_project = await project_db.update_project(ObjectId(projectId), update_data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="A project with this topic already exists in the batch")
     
     if not updated_project:
         raise HTTPException(status_code=404, detail="Project not found")
+    if update_data.image is not None:
+        await _probe_dimensions_later(updated_project.id)
     return updated_project
 
 @router.delete("/{projectId}", status_code=204, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
@@ -69,7 +250,9 @@ async def delete_existing_project(projectId: str):
 
 @router.put("/{projectId}/featured", response_model=ProjectSchema, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
 async def set_project_featured_status(projectId: str, featured: bool = Body(..., embed=True)):
-    updated_project = await project_db.set_featured_status(projectId, featured)
+    if not ObjectId.is_valid(projectId):
+        raise HTTPException(status_code=400, detail="Invalid project ID")
+    updated_project = await project_db.set_featured_status(ObjectId(projectId), featured)
     if not updated_project:
         raise HTTPException(status_code=404, detail="Project not found")
     return updated_project
@@ -80,45 +263,57 @@ async def set_project_featured_status(projectId: str, featured: bool = Body(...,
 async def add_feedback(projectId: str, feedback: FeedbackCreate):
     if not ObjectId.is_valid(projectId):
         raise HTTPException(status_code=400, detail="Invalid project ID")
-    project = await Project.get(ObjectId(projectId))
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
+    if not await project_db.project_is_visible(ObjectId(projectId)):
+        raise HTTPException(status_code=404, detail="Project not found or not visible")
+
     new_feedback = Feedback(
         project_id=projectId,
         username=feedback.username,
         content=feedback.content,
     )
-    await new_feedback.insert()
-    return new_feedback
+    return await feedback_db.add_feedback(new_feedback)
 
 
 @router.get("/{projectId}/feedback", response_model=List[FeedbackResponse], dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
-async def get_feedback_for_project(projectId: str):
+async def get_feedback_for_project(
+    projectId: str,
+    limit: int = PageSize,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+):
     if not ObjectId.is_valid(projectId):
         raise HTTPException(status_code=400, detail="Invalid project ID")
-    project = await Project.get(ObjectId(projectId))
-    if not project or not project.visibility:
+    if not await project_db.project_is_visible(ObjectId(projectId)):
         raise HTTPException(status_code=404, detail="Project not found or not visible")
-    return await Feedback.find({"project_id": projectId}).sort("-created_at").to_list()
+    try:
+        feedback, next_cursor = await feedback_db.list_feedback(projectId, limit, cursor, raw=True)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = await feedback_db.count_feedback(projectId) if include_total else None
+    return FastJSONResponse(
+        documents_payload(feedback, FeedbackResponse),
+        headers=_page_headers(next_cursor, total),
+    )
+
+@router.post("/feedback/bulk", response_model=FeedbackBulkResponse, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
+async def moderate_feedback(request: FeedbackBulkRequest):
+    results = await feedback_db.moderate_feedback([op.dict() for op in request.operations])
+    return FeedbackBulkResponse(results=results)
 
 @router.delete("/feedback/{feedbackId}", status_code=204, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
 async def delete_feedback_by_id(feedbackId: str):
     if not ObjectId.is_valid(feedbackId):
         raise HTTPException(status_code=400, detail="Invalid feedback ID")
-    feedback = await Feedback.get(ObjectId(feedbackId))
-    if not feedback:
+    deleted = await feedback_db.delete_feedback(ObjectId(feedbackId))
+    if not deleted:
         raise HTTPException(status_code=404, detail="Feedback not found")
-    await feedback.delete()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.put("/feedback/{feedbackId}/rank", response_model=FeedbackResponse, dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
 async def rank_feedback(feedbackId: str, rank_update: FeedbackUpdate):
     if not ObjectId.is_valid(feedbackId):
         raise HTTPException(status_code=400, detail="Invalid feedback ID")
-    feedback = await Feedback.get(ObjectId(feedbackId))
+    feedback = await feedback_db.update_feedback_rank(ObjectId(feedbackId), rank_update.rank)
     if not feedback:
         raise HTTPException(status_code=404, detail="Feedback not found")
-    feedback.rank = rank_update.rank
-    await feedback.save()
     return feedback
\ No newline at end of file
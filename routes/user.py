@@ -1,10 +1,12 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends, Query
 
 from auth.jwt_bearer import JWTBearer
-from schemas.keycloak import KeycloakUser
-from services.keycloak import get_all_users, get_user_by_id
+from core.config import settings
+from schemas.keycloak import KeycloakUser, KeycloakUserBatchRequest, KeycloakUserBatchResponse
+from services.keycloak import get_user_by_id, get_users_page
+from services.user_directory import user_directory
 
 router = APIRouter()
 
@@ -14,8 +16,15 @@ router = APIRouter()
     response_model=List[KeycloakUser],
     dependencies=[Depends(JWTBearer(allowed_roles=[]))],
 )
-async def keycloak_users():
-    return get_all_users()
+async def keycloak_users(
+    search: Optional[str] = None,
+    first: int = Query(0, ge=0),
+    max: int = Query(100, ge=1, le=1000),
+):
+    if user_directory.ready:
+        return user_directory.search(search, first, max)
+    # Directory not synced yet: let Keycloak filter and page
+    return await get_users_page(first, max, search)
 
 
 @router.get(
@@ -24,7 +33,30 @@ async def keycloak_users():
     dependencies=[Depends(JWTBearer(allowed_roles=[]))],
 )
 async def keycloak_user(user_id: str):
-    return get_user_by_id(user_id)
+    user = user_directory.get(user_id)
+    if user is None:
+        user = await get_user_by_id(user_id)
+        user_directory.add(user)
+    return user
+
+
+@router.post(
+    "/keycloak-users/batch",
+    response_model=KeycloakUserBatchResponse,
+    dependencies=[Depends(JWTBearer(allowed_roles=[]))],
+)
+async def keycloak_users_batch(request: KeycloakUserBatchRequest = Body(...)):
+    """
+    Resolve many users in one call. Unknown or failing ids come back with a
+    placeholder user and an entry in `errors`.
+    """
+    users, errors = await user_directory.resolve(
+        request.ids,
+        concurrency=settings.USER_BATCH_CONCURRENCY,
+        default_username=request.default_username,
+        default_profile_pic_url=request.default_profile_pic_url,
+    )
+    return KeycloakUserBatchResponse(users=users, errors=errors)
 
 
 @router.get("/me", response_model=dict)
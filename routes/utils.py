@@ -1,14 +1,63 @@
-from fastapi import APIRouter, Body
+from typing import Literal, Optional
 
+from bson import ObjectId
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+
+from auth.jwt_bearer import JWTBearer
+from core.config import settings
+from database import project as project_db
 from schemas.thumbnail import thumbnail
-from services.thumbnail_service import generate_thumbnail
+from services.thumbnail_service import ThumbnailError, generate_thumbnail, thumbnail_key, thumbnail_params
 
 router = APIRouter()
 
 
-@router.post("/generate_thumbnail")
-async def user_generate_thumbnail(thumbnail: thumbnail = Body(...)):
+def _thumbnail_headers(key: str) -> dict:
+    # The key covers URL, size, format and quality, so a given URL always means the same bytes
+    return {"ETag": f'"{key}"', "Cache-Control": f"public, max-age={settings.THUMBNAIL_CACHE_MAX_AGE}"}
+
+
+async def _thumbnail_response(request: Request, spec: thumbnail) -> Response:
+    # Revalidations are answered from the key alone, without reading the cache or rendering
+    headers = _thumbnail_headers(thumbnail_key(spec))
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
     try:
-        return generate_thumbnail(thumbnail)
-    except Exception as e:
-        return {"error": str(e)}
+        data, media_type, key = await generate_thumbnail(spec)
+    except ThumbnailError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return Response(content=data, media_type=media_type, headers=_thumbnail_headers(key))
+
+
+# Arbitrary URLs: signed-in users only, since each one is fetched, rendered and cached
+@router.post("/generate_thumbnail", dependencies=[Depends(JWTBearer(allowed_roles=["view-profile", "manage-account"]))])
+async def user_generate_thumbnail(request: Request, thumbnail: thumbnail = Body(...)):
+    return await _thumbnail_response(request, thumbnail)
+
+
+@router.get("/thumbnail")
+async def get_thumbnail(
+    request: Request,
+    projectId: str,
+    width: Optional[int] = Query(None, ge=16, le=settings.THUMBNAIL_MAX_DIMENSION),
+    height: Optional[int] = Query(None, ge=16, le=settings.THUMBNAIL_MAX_DIMENSION),
+    format: Optional[Literal["webp", "jpeg", "png"]] = None,
+):
+    """
+    Thumbnail of a visible project's image, as a cacheable URL for <img src>.
+    Public, so it only renders images already stored on projects, and only
+    in the THUMBNAIL_SIZES boxes.
+    """
+    if not ObjectId.is_valid(projectId):
+        raise HTTPException(status_code=400, detail="Invalid project ID")
+    box_width, box_height, _ = thumbnail_params(width, height, format)
+    if (box_width, box_height) not in {tuple(size) for size in settings.THUMBNAIL_SIZES}:
+        sizes = ", ".join(f"{w}x{h}" for w, h in settings.THUMBNAIL_SIZES)
+        raise HTTPException(status_code=400, detail=f"Unsupported thumbnail size {box_width}x{box_height}; use one of {sizes}")
+    project = await project_db.get_visible_project_raw(ObjectId(projectId))
+    if project is None or not project.get("image"):
+        raise HTTPException(status_code=404, detail="Project not found or not visible")
+    return await _thumbnail_response(
+        request,
+        thumbnail(title=project.get("topic", ""), weburl=project["image"], width=width, height=height, format=format),
+    )
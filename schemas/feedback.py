@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
 
 from beanie import PydanticObjectId
 from pydantic import BaseModel, Field
@@ -55,3 +55,36 @@ class FeedbackResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class FeedbackBulkOperation(BaseModel):
+    id: str
+    action: Literal["rank", "delete"]
+    # Required for "rank"
+    rank: Optional[int] = None
+
+
+class FeedbackBulkRequest(BaseModel):
+    operations: List[FeedbackBulkOperation] = Field(..., min_length=1, max_length=1000)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "operations": [
+                    {"id": "65a1f0c2e4b0a1b2c3d4e5f6", "action": "rank", "rank": 1},
+                    {"id": "65a1f0c2e4b0a1b2c3d4e5f7", "action": "delete"},
+                ]
+            }
+        }
+
+
+class FeedbackBulkResult(BaseModel):
+    id: str
+    action: str
+    # "updated", "deleted", "not_found", "invalid" or "error"
+    status: str
+    detail: Optional[str] = None
+
+
+class FeedbackBulkResponse(BaseModel):
+    results: List[FeedbackBulkResult]
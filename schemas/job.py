@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Any, List, Optional
+
+from beanie import PydanticObjectId
+from pydantic import BaseModel, Field
+
+
+class JobSchema(BaseModel):
+    id: PydanticObjectId
+    queue: str
+    name: str
+    status: str
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ProbeDimensionsRequest(BaseModel):
+    # Empty: every project
+    project_ids: List[str] = Field(default_factory=list, max_length=10000)
+    dry_run: bool = False
@@ -1,6 +1,6 @@
 from typing import Any
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 
 class KeycloakUser(BaseModel):
@@ -15,3 +15,23 @@ class KeycloakUser(BaseModel):
     model_config = {
         "extra": "ignore",
     }
+
+
+class KeycloakUserBatchRequest(BaseModel):
+    ids: list[str] = Field(..., min_length=1, max_length=500)
+    default_username: str = ""
+    default_profile_pic_url: str = ""
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "ids": ["6f1c2f0e-4b7a-4a43-9a5e-2f7c1d9b8e10", "0b8f1d7c-52a9-4c1e-8f36-9e4d2a7b6c55"],
+                "default_username": "Unknown",
+            }
+        },
+    }
+
+
+class KeycloakUserBatchResponse(BaseModel):
+    users: dict[str, KeycloakUser]
+    errors: dict[str, str] = {}
@@ -2,7 +2,15 @@ from datetime import datetime
 from typing import List, Optional
 
 from beanie import PydanticObjectId
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+
+class FeedbackStatsSchema(BaseModel):
+    count: int = 0
+    ranked_count: int = 0
+    rank_sum: int = 0
+    rank_avg: Optional[float] = None
+    latest_at: Optional[datetime] = None
 
 
 class ProjectSchema(BaseModel):
@@ -19,7 +27,8 @@ class ProjectSchema(BaseModel):
     visibility: bool
     featured: bool
     created_at: datetime
-
+    # None until the project's stats have been built (python -m database.feedback_stats)
+    feedback_stats: Optional[FeedbackStatsSchema] = None
 
     class Config:
         from_attributes = True
@@ -74,5 +83,53 @@ class ProjectUpdateSchema(BaseModel):
         }
 
 
+class ProjectBulkFilter(BaseModel):
+    batch: Optional[str] = None
+    visibility: Optional[bool] = None
+    featured: Optional[bool] = None
+
+
+class ProjectBulkUpdateSchema(BaseModel):
+    """Set visibility and/or featured on the projects selected by `ids` or by `filter` (exactly one)."""
+    ids: Optional[List[str]] = Field(None, min_length=1, max_length=1000)
+    filter: Optional[ProjectBulkFilter] = None
+    visibility: Optional[bool] = None
+    featured: Optional[bool] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "filter": {"batch": "2026"},
+                "visibility": True,
+                "featured": False,
+            }
+        }
+
+
+class ProjectBulkUpdateResponse(BaseModel):
+    matched: int
+    modified: int
+
+
+class ProjectCardSchema(BaseModel):
+    id: PydanticObjectId
+    topic: str
+    batch: str
+    image: str
+    width: int
+    height: int
+
+    class Config:
+        from_attributes = True
+
+
 class ProjectListSchema(BaseModel):
     projects: List[ProjectSchema]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+
+class ProjectCardListSchema(BaseModel):
+    projects: List[ProjectCardSchema]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
@@ -1,14 +1,24 @@
-from pydantic import BaseModel
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+from core.config import settings
 
 
 class thumbnail(BaseModel):
     title: str
     weburl: str
+    # Bounding box; the image keeps its aspect ratio. Height defaults to width.
+    width: Optional[int] = Field(None, ge=16, le=settings.THUMBNAIL_MAX_DIMENSION)
+    height: Optional[int] = Field(None, ge=16, le=settings.THUMBNAIL_MAX_DIMENSION)
+    format: Optional[Literal["webp", "jpeg", "png"]] = None
 
     class Config:
         json_schema_extra = {
             "example": {
                 "title": "Google",
                 "weburl": "https://www.google.com/",
+                "width": 400,
+                "format": "webp",
             }
         }
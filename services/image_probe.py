@@ -0,0 +1,262 @@
+"""
+Image dimensions from the first few kilobytes of a file.
+
+PNG, GIF, WebP and JPEG headers are parsed as bytes arrive from a ranged GET
+(`Range: bytes=0-N`), and the transfer stops as soon as the size is known.
+Servers that ignore Range still work; the body is simply abandoned early.
+JPEG sizes honour the EXIF orientation, so they match what browsers display.
+
+Stored project sizes can be checked and fixed in bulk:
+
+    python -m services.image_probe --dry-run
+"""
+import argparse
+import asyncio
+import struct
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import httpx
+
+from core.config import settings
+from database import project as project_db
+from services.remote_fetch import UnsafeURL, stream_url
+
+Size = Tuple[int, int]
+
+
+class ProbeError(Exception):
+    """The image's dimensions couldn't be determined."""
+
+
+# --- Header parsing ---
+
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _exif_orientation(segment: bytes) -> Optional[int]:
+    """Orientation tag (0x0112) from an APP1 Exif segment, if present."""
+    if not segment.startswith(b"Exif\x00\x00"):
+        return None
+    tiff = bytes(segment[6:])
+    endian = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if endian is None:
+        return None
+    try:
+        offset = struct.unpack_from(endian + "I", tiff, 4)[0]
+        count = struct.unpack_from(endian + "H", tiff, offset)[0]
+        for index in range(count):
+            entry = offset + 2 + index * 12
+            if struct.unpack_from(endian + "H", tiff, entry)[0] == 0x0112:
+                return struct.unpack_from(endian + "H", tiff, entry + 8)[0]
+    except struct.error:
+        pass
+    return None
+
+
+def _jpeg_size(data: bytes) -> Optional[Size]:
+    orientation = None
+    index = 2
+    while True:
+        if index + 4 > len(data):
+            return None
+        if data[index] != 0xFF:
+            raise ProbeError("Corrupt JPEG")
+        marker = data[index + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            index += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            index += 2
+            continue
+        length = struct.unpack_from(">H", data, index + 2)[0]
+        if marker in _JPEG_SOF:
+            if index + 9 > len(data):
+                return None
+            height, width = struct.unpack_from(">HH", data, index + 5)
+            # Orientations 5-8 rotate by 90 degrees
+            return (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+        if marker == 0xDA:
+            raise ProbeError("JPEG without a frame header")
+        end = index + 2 + length
+        if marker == 0xE1 and orientation is None:
+            if end > len(data):
+                return None
+            orientation = _exif_orientation(data[index + 4:end])
+        index = end
+
+
+def _webp_size(data: bytes) -> Optional[Size]:
+    chunk = data[12:16]
+    if chunk == b"VP8 ":
+        if len(data) < 30:
+            return None
+        if data[23:26] != b"\x9d\x01\x2a":
+            raise ProbeError("Corrupt WebP")
+        width, height = struct.unpack_from("<HH", data, 26)
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        if len(data) < 25:
+            return None
+        bits = struct.unpack_from("<I", data, 21)[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        if len(data) < 30:
+            return None
+        return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    raise ProbeError("Unsupported WebP variant")
+
+
+def image_size(data: bytes) -> Optional[Size]:
+    """
+    (width, height) from the start of a PNG, GIF, WebP or JPEG file.
+    None means more bytes are needed; ProbeError means the format isn't supported.
+    """
+    if len(data) < 16:
+        return None
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(data) < 24:
+            return None
+        return struct.unpack_from(">II", data, 16)
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return struct.unpack_from("<HH", data, 6)
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return _webp_size(data)
+    if data[:2] == b"\xff\xd8":
+        return _jpeg_size(data)
+    raise ProbeError("Not a PNG, GIF, WebP or JPEG image")
+
+
+# --- Probing ---
+
+class ImageProbe:
+    """Concurrent, cached dimension probes; at most `concurrency` fetches run at once."""
+
+    def __init__(self, concurrency: int, max_bytes: int, cache_ttl: float, cache_size: int, client: Optional[httpx.AsyncClient] = None):
+        self.max_bytes = max_bytes
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._client = client
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._cache: "OrderedDict[str, Tuple[Size, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=settings.IMAGE_PROBE_TIMEOUT)
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch_size(self, url: str) -> Size:
+        async with self._semaphore:
+            try:
+                async with stream_url(self._get_client(), url, headers={"Range": f"bytes=0-{self.max_bytes - 1}"}) as (response, _):
+                    if response.status_code not in (200, 206):
+                        raise ProbeError(f"Image returned HTTP {response.status_code}")
+                    data = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        data += chunk
+                        size = image_size(data)
+                        if size is not None:
+                            return size
+                        if len(data) >= self.max_bytes:
+                            break
+            except (UnsafeURL, httpx.HTTPError) as e:
+                raise ProbeError(f"Could not fetch {url}: {e}")
+        raise ProbeError(f"No image header in the first {self.max_bytes} bytes")
+
+    async def _probe(self, url: str) -> Size:
+        size = await self._fetch_size(url)
+        self._cache[url] = (size, time.monotonic() + self.cache_ttl)
+        self._cache.move_to_end(url)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return size
+
+    async def probe(self, url: str) -> Size:
+        cached = self._cache.get(url)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.create_task(self._probe(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def probe_many(self, urls: Iterable[str]) -> Dict[str, Union[Size, ProbeError]]:
+        """Probe several URLs concurrently; failures are returned, not raised."""
+        urls = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*(self.probe(url) for url in urls), return_exceptions=True)
+        return dict(zip(urls, results))
+
+
+image_probe = ImageProbe(
+    concurrency=settings.IMAGE_PROBE_CONCURRENCY,
+    max_bytes=settings.IMAGE_PROBE_MAX_BYTES,
+    cache_ttl=settings.IMAGE_PROBE_CACHE_TTL,
+    cache_size=settings.IMAGE_PROBE_CACHE_SIZE,
+)
+
+
+# --- Backfill ---
+
+async def _backfill_batch(projects: List[dict], totals: dict, dry_run: bool) -> None:
+    sizes = await image_probe.probe_many(project["image"] for project in projects if project.get("image"))
+    updates = []
+    for project in projects:
+        size = sizes.get(project.get("image"))
+        totals["checked"] += 1
+        if not isinstance(size, tuple):
+            totals["failed"] += 1
+            if size is not None:
+                print(f"Error probing {project['_id']}: {size}")
+            continue
+        width, height = size
+        if (project.get("width"), project.get("height")) != (width, height):
+            updates.append((project["_id"], width, height))
+    totals["fixed"] += len(updates)
+    if updates and not dry_run:
+        await project_db.set_dimensions(updates)
+
+
+async def backfill_dimensions(query: Optional[dict] = None, batch_size: int = 200, dry_run: bool = False) -> dict:
+    """Probe every matching project's image and correct stored width/height with one bulk write per batch."""
+    totals = {"checked": 0, "fixed": 0, "failed": 0}
+    batch = []
+    projects = project_db.iter_projects(query or {}, batch_size=batch_size, projection={"image": 1, "width": 1, "height": 1})
+    async for project in projects:
+        batch.append(project)
+        if len(batch) >= batch_size:
+            await _backfill_batch(batch, totals, dry_run)
+            batch = []
+    if batch:
+        await _backfill_batch(batch, totals, dry_run)
+    return totals
+
+
+async def main() -> None:
+    from core.database import close_db_connection, init_db
+
+    parser = argparse.ArgumentParser(description="Fix stored project image sizes from the images themselves.")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true", help="Report mismatches without writing them")
+    args = parser.parse_args()
+
+    await init_db()
+    try:
+        totals = await backfill_dimensions(batch_size=args.batch_size, dry_run=args.dry_run)
+        print(f"Image dimensions: {totals}")
+    finally:
+        await image_probe.close()
+        await close_db_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
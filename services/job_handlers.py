@@ -0,0 +1,26 @@
+"""Background job handlers. Imported by app.py so they are registered in every process."""
+from bson import ObjectId
+
+from database import feedback_stats
+from database.project import reindex_search_tokens
+from services.image_probe import backfill_dimensions
+from services.jobs import job_handler
+
+
+@job_handler("probe_dimensions", queue="images")
+async def probe_dimensions(payload: dict) -> dict:
+    """Correct stored image sizes, for `project_ids` or, without them, every project."""
+    query = {}
+    if payload.get("project_ids"):
+        query = {"_id": {"$in": [ObjectId(id) for id in payload["project_ids"]]}}
+    return await backfill_dimensions(query, dry_run=payload.get("dry_run", False))
+
+
+@job_handler("rebuild_feedback_stats")
+async def rebuild_feedback_stats(payload: dict) -> dict:
+    return {"projects": await feedback_stats.rebuild()}
+
+
+@job_handler("reindex_search_tokens")
+async def reindex_search(payload: dict) -> dict:
+    return {"modified": await reindex_search_tokens()}
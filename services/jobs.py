@@ -0,0 +1,168 @@
+"""
+Background jobs persisted in Mongo (`jobs` collection).
+
+Handlers are plain async functions registered by name with @job_handler,
+taking the job's payload and returning a JSON-able result. enqueue() stores
+a job and returns at once. Every app process runs a JobRunner with
+JOB_QUEUES[queue] concurrent loops per queue, so work spreads over all
+uvicorn workers.
+
+A loop claims a job with an atomic find-one-and-update that leases it for
+JOB_LEASE_SECONDS and keeps renewing the lease while the handler runs. If a
+process dies mid-job, the lease lapses and the job is requeued for another
+worker. Failed attempts are retried with exponential backoff until
+max_attempts is reached.
+"""
+import asyncio
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.config import settings
+from database import jobs as jobs_db
+from models.job import Job
+
+Handler = Callable[[dict], Awaitable[object]]
+
+# name -> (queue, handler)
+_handlers: Dict[str, Tuple[str, Handler]] = {}
+
+
+def job_handler(name: str, queue: str = "default"):
+    """Register the decorated coroutine function as the handler of jobs called `name`."""
+    def register(func: Handler) -> Handler:
+        _handlers[name] = (queue, func)
+        return func
+    return register
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given (1-based) attempt."""
+    delay = min(settings.JOB_RETRY_BASE_DELAY * 2 ** (attempt - 1), settings.JOB_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class JobRunner:
+    def __init__(self, queues: Dict[str, int], lease: float, poll_interval: float):
+        self.queues = queues
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def wake(self, queue: str) -> None:
+        """Let an idle loop of this process pick up a just-enqueued job without waiting for the next poll."""
+        event = self._wakeups.get(queue)
+        if event is not None:
+            event.set()
+
+    async def _keep_lease(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await jobs_db.renew_lease(job.id, self.worker_id, self.lease):
+                return
+
+    async def _run(self, job: Job) -> None:
+        entry = _handlers.get(job.name)
+        if entry is None:
+            await jobs_db.fail_job(job.id, self.worker_id, f"No handler for job {job.name}", None)
+            return
+        if job.attempts > job.max_attempts:
+            # Claimed again after its worker died on the last attempt
+            await jobs_db.fail_job(job.id, self.worker_id, job.error or "Lease expired", None)
+            return
+
+        keeper = asyncio.create_task(self._keep_lease(job))
+        try:
+            result = await entry[1](job.payload)
+        except Exception as e:
+            self.failed += 1
+            print(f"Error running job {job.name} ({job.id}), attempt {job.attempts}: {e}")
+            retry_at = None
+            if job.attempts < job.max_attempts:
+                retry_at = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+            await jobs_db.fail_job(job.id, self.worker_id, str(e) or type(e).__name__, retry_at)
+        else:
+            self.processed += 1
+            await jobs_db.complete_job(job.id, self.worker_id, result)
+        finally:
+            keeper.cancel()
+
+    async def _loop(self, queue: str) -> None:
+        wakeup = self._wakeups[queue]
+        while True:
+            try:
+                job = await jobs_db.claim_job(queue, self.worker_id, self.lease)
+            except Exception as e:
+                print(f"Error claiming job from {queue}: {e}")
+                job = None
+            if job is not None:
+                try:
+                    await self._run(job)
+                except Exception as e:
+                    # E.g. Mongo unavailable or a result BSON can't store; the lease
+                    # lapses and the job is requeued, this loop keeps serving the queue
+                    print(f"Error finishing job {job.name} ({job.id}): {e}")
+                continue
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease)
+            try:
+                requeued = await jobs_db.requeue_expired_jobs()
+                if requeued:
+                    print(f"Requeued {requeued} jobs with expired leases")
+            except Exception as e:
+                print(f"Error requeueing expired jobs: {e}")
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        for queue, concurrency in self.queues.items():
+            self._wakeups[queue] = asyncio.Event()
+            self._tasks += [asyncio.create_task(self._loop(queue)) for _ in range(concurrency)]
+        self._tasks.append(asyncio.create_task(self._reap()))
+
+    async def stop(self) -> None:
+        """Cancel the loops. Interrupted jobs are picked up again once their lease lapses."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {"worker": self.worker_id, "running": self.running, "processed": self.processed, "failed": self.failed}
+
+
+job_runner = JobRunner(
+    queues=settings.JOB_QUEUES,
+    lease=settings.JOB_LEASE_SECONDS,
+    poll_interval=settings.JOB_POLL_INTERVAL,
+)
+
+
+async def enqueue(name: str, payload: Optional[dict] = None, delay: float = 0, max_attempts: Optional[int] = None) -> Job:
+    """Persist a job for the handler registered as `name`; it runs on whichever process claims it first."""
+    if name not in _handlers:
+        raise ValueError(f"No handler registered for job {name}")
+    queue = _handlers[name][0]
+    run_at = datetime.utcnow() + timedelta(seconds=delay) if delay else None
+    job = await jobs_db.enqueue_job(queue, name, payload or {}, run_at, max_attempts)
+    if not delay:
+        job_runner.wake(queue)
+    return job
@@ -1,22 +1,139 @@
-from typing import List, Optional
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Set
+from urllib.parse import quote
 
 import httpx
 from fastapi import HTTPException
+from pydantic import ValidationError
 
 from core.config import settings
+from core.metrics import keycloak_errors, keycloak_request_duration
 from schemas.keycloak import KeycloakUser
 
-DEFAULT_TIMEOUT = 10.0
+DEFAULT_TIMEOUT = httpx.Timeout(settings.KEYCLOAK_TIMEOUT, connect=settings.KEYCLOAK_CONNECT_TIMEOUT)
+
+# Shared client, created once in the app's startup handler
+_client: Optional[httpx.AsyncClient] = None
+
+# Service-account (client credentials) token, shared by every admin API call
+_service_token = {
+    "access_token": None,
+    "expires_at": 0.0,
+    "refresh_at": 0.0,
+}
+_token_lock = asyncio.Lock()
+_token_refresher: Optional[asyncio.Task] = None
+
+# Self-service user events that create, change or remove an account
+USER_EVENT_TYPES = ["REGISTER", "UPDATE_PROFILE", "UPDATE_EMAIL", "DELETE_ACCOUNT"]
+
+
+def _operation(path: str) -> str:
+    """Coarse metric label for a Keycloak URL path; ids never end up in labels."""
+    if path.endswith("/protocol/openid-connect/token"):
+        return "token"
+    if path.endswith("/protocol/openid-connect/certs"):
+        return "jwks"
+    if "/admin/realms/" in path:
+        rest = path.split("/users", 1)
+        if len(rest) == 2:
+            return "users" if rest[1] in ("", "/") else "user"
+        return "admin"
+    return "other"
+
+
+class MetricsTransport(httpx.AsyncBaseTransport):
+    """Times every request to Keycloak and counts the failed ones."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        operation = _operation(request.url.path)
+        started = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception as e:
+            keycloak_errors.inc(operation, type(e).__name__)
+            raise
+        finally:
+            keycloak_request_duration.observe(operation, value=time.perf_counter() - started)
+        if response.status_code >= 400:
+            keycloak_errors.inc(operation, f"{response.status_code // 100}xx")
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = settings.KEYCLOAK_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("KEYCLOAK_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+    # Pool settings go on the transport, since the client ignores them when given one
+    transport = httpx.AsyncHTTPTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.KEYCLOAK_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.KEYCLOAK_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.KEYCLOAK_KEEPALIVE_EXPIRY,
+        ),
+    )
+    if settings.METRICS_ENABLED:
+        transport = MetricsTransport(transport)
+    return httpx.AsyncClient(
+        base_url=settings.KEYCLOAK_URL,
+        timeout=DEFAULT_TIMEOUT,
+        transport=transport,
+    )
+
+
+async def init_keycloak_client() -> None:
+    """Create the pooled Keycloak client and start the service token refresher."""
+    global _client, _token_refresher
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    if _token_refresher is None or _token_refresher.done():
+        _token_refresher = asyncio.create_task(_refresh_token_periodically())
+
+
+async def close_keycloak_client() -> None:
+    """Stop the token refresher and close the pooled Keycloak client and its connections."""
+    global _client, _token_refresher
+    if _token_refresher is not None:
+        _token_refresher.cancel()
+        try:
+            await _token_refresher
+        except asyncio.CancelledError:
+            pass
+        _token_refresher = None
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_keycloak_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily outside of the app lifespan (scripts, tests)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
 
 
 def _handle_httpx_error(exc: httpx.HTTPError) -> None:
     raise HTTPException(status_code=502, detail=f"Error communicating with Keycloak: {exc}")
 
 
-def get_keycloak_token() -> Optional[str]:
+async def _request_keycloak_token() -> dict:
     try:
-        resp = httpx.post(
-            f"{settings.KEYCLOAK_URL}/realms/{settings.REALM}/protocol/openid-connect/token",
+        resp = await get_keycloak_client().post(
+            f"/realms/{settings.REALM}/protocol/openid-connect/token",
             data={
                 "client_id": settings.CLIENT_ID,
                 "client_secret": settings.CLIENT_SECRET,
@@ -27,7 +144,7 @@ def get_keycloak_token() -> Optional[str]:
     except httpx.HTTPError as exc:
         _handle_httpx_error(exc)
     if resp.status_code == 200:
-        return resp.json().get("access_token")
+        return resp.json()
     if resp.status_code == 401:
         raise HTTPException(
             status_code=401,
@@ -39,44 +156,183 @@ def get_keycloak_token() -> Optional[str]:
     )
 
 
-def get_all_users() -> List[KeycloakUser]:
-    token = get_keycloak_token()
-    if not token:
-        raise HTTPException(
-            status_code=401,
-            detail="Unauthorized access - empty token received from Keycloak",
-        )
-    try:
-        resp = httpx.get(
-            f"{settings.KEYCLOAK_URL}/admin/realms/{settings.REALM}/users",
-            headers={"Authorization": f"Bearer {token}"},
-            timeout=DEFAULT_TIMEOUT,
-        )
-    except httpx.HTTPError as exc:
-        _handle_httpx_error(exc)
+def _cached_token() -> Optional[str]:
+    if time.monotonic() < _service_token["expires_at"]:
+        return _service_token["access_token"]
+    return None
+
+
+async def get_keycloak_token() -> Optional[str]:
+    """
+    Returns the service-account access token, reusing the cached one until it expires.
+    Concurrent callers share a single token request.
+    """
+    token = _cached_token()
+    if token:
+        return token
+    async with _token_lock:
+        token = _cached_token()
+        if token:
+            return token
+        return await _refresh_keycloak_token()
+
+
+async def _refresh_keycloak_token() -> Optional[str]:
+    data = await _request_keycloak_token()
+    token = data.get("access_token")
+    # Stop using the token slightly before Keycloak does
+    lifetime = float(data.get("expires_in") or 60) - settings.KEYCLOAK_TOKEN_EXPIRY_SKEW
+    lifetime = max(lifetime, 0.0)
+    now = time.monotonic()
+    _service_token["access_token"] = token
+    _service_token["expires_at"] = now + lifetime
+    # Short-lived tokens (expires_in <= skew) still wait a little, or the refresher would spin
+    _service_token["refresh_at"] = now + max(
+        lifetime - settings.KEYCLOAK_TOKEN_REFRESH_AHEAD, lifetime / 2, settings.KEYCLOAK_TOKEN_RETRY_INTERVAL
+    )
+    return token
+
+
+def invalidate_keycloak_token(token: Optional[str]) -> None:
+    """Drops the cached token if it is still the one Keycloak rejected."""
+    if token and _service_token["access_token"] == token:
+        _service_token["access_token"] = None
+        _service_token["expires_at"] = 0.0
+        _service_token["refresh_at"] = 0.0
+
+
+async def _refresh_token_periodically() -> None:
+    """Keeps the service token fresh so request handlers never wait on the token endpoint."""
+    while True:
+        delay = _service_token["refresh_at"] - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            continue
+        try:
+            async with _token_lock:
+                await _refresh_keycloak_token()
+        except HTTPException as exc:
+            print(f"Error refreshing Keycloak service token: {exc.detail}")
+            await asyncio.sleep(settings.KEYCLOAK_TOKEN_RETRY_INTERVAL)
+        except Exception as exc:
+            # E.g. a non-JSON body from the token endpoint; keep the refresher alive
+            print(f"Error refreshing Keycloak service token: {exc}")
+            await asyncio.sleep(settings.KEYCLOAK_TOKEN_RETRY_INTERVAL)
+
+
+async def _admin_get(path: str, **kwargs) -> httpx.Response:
+    """
+    GET against the Keycloak admin API with the service token.
+    A 401 invalidates the cached token and the request is retried once.
+    """
+    for attempt in range(2):
+        token = await get_keycloak_token()
+        if not token:
+            raise HTTPException(
+                status_code=401,
+                detail="Unauthorized access - empty token received from Keycloak",
+            )
+        try:
+            resp = await get_keycloak_client().get(
+                f"/admin/realms/{settings.REALM}{path}",
+                headers={"Authorization": f"Bearer {token}"},
+                timeout=DEFAULT_TIMEOUT,
+                **kwargs,
+            )
+        except httpx.HTTPError as exc:
+            _handle_httpx_error(exc)
+        if resp.status_code != 401 or attempt:
+            return resp
+        invalidate_keycloak_token(token)
+    return resp
+
+
+async def get_users_page(first: int = 0, max_results: int = 100, search: Optional[str] = None) -> List[KeycloakUser]:
+    params = {"first": first, "max": max_results}
+    if search:
+        params["search"] = search
+    resp = await _admin_get("/users", params=params)
     if resp.status_code == 200:
-        return [KeycloakUser(**user) for user in resp.json()]
+        users = []
+        for user in resp.json():
+            try:
+                users.append(KeycloakUser(**user))
+            except ValidationError as exc:
+                # One malformed account (e.g. an invalid email) mustn't hide the rest of the page
+                print(f"Skipping Keycloak user {user.get('id')}: {exc}")
+        return users
     raise HTTPException(
         status_code=resp.status_code,
         detail=f"Keycloak returned a {resp.status_code} - {resp.text} error",
     )
 
 
-def get_user_by_id(user_id: str) -> KeycloakUser:
-    token = get_keycloak_token()
-    if not token:
-        raise HTTPException(
-            status_code=401,
-            detail="Unauthorized access - empty token received from Keycloak",
-        )
-    try:
-        resp = httpx.get(
-            f"{settings.KEYCLOAK_URL}/admin/realms/{settings.REALM}/users/{user_id}",
-            headers={"Authorization": f"Bearer {token}"},
-            timeout=DEFAULT_TIMEOUT,
-        )
-    except httpx.HTTPError as exc:
-        _handle_httpx_error(exc)
+async def iter_users(page_size: int = 100) -> AsyncIterator[List[KeycloakUser]]:
+    """Streams the whole realm page by page using Keycloak's first/max paging."""
+    first = 0
+    while True:
+        page = await get_users_page(first, page_size)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        first += page_size
+
+
+def _user_id_from_path(resource_path: str) -> Optional[str]:
+    # Admin event paths look like "users/<id>" or "users/<id>/role-mappings/..."
+    parts = resource_path.split("/")
+    return parts[1] if len(parts) > 1 and parts[0] == "users" else None
+
+
+async def changed_user_ids(since: float, page_size: int = 100) -> Set[str]:
+    """
+    Ids of users created, updated or deleted since `since` (epoch seconds),
+    read from the realm's admin events and self-service user events. Needs
+    events enabled on the realm and the view-events role; without them this
+    finds nothing, so callers still run a periodic full sync.
+    """
+    since_ms = int(since * 1000)
+    # dateFrom only has day precision; exact times are filtered below
+    date_from = datetime.fromtimestamp(since, timezone.utc).strftime("%Y-%m-%d")
+    sources = (
+        ("/admin-events", {"resourceTypes": "USER", "dateFrom": date_from}, lambda event: _user_id_from_path(event.get("resourcePath", ""))),
+        ("/events", {"type": USER_EVENT_TYPES, "dateFrom": date_from}, lambda event: event.get("userId")),
+    )
+    user_ids = set()
+    for path, params, user_id_of in sources:
+        first = 0
+        while True:
+            resp = await _admin_get(path, params={**params, "first": first, "max": page_size})
+            if resp.status_code != 200:
+                raise HTTPException(
+                    status_code=resp.status_code,
+                    detail=f"Keycloak returned a {resp.status_code} - {resp.text} error",
+                )
+            events = resp.json()
+            for event in events:
+                user_id = user_id_of(event)
+                if user_id and event.get("time", 0) >= since_ms:
+                    user_ids.add(user_id)
+            # Newest first: done once a page ends before the window
+            if len(events) < page_size or events[-1].get("time", 0) < since_ms:
+                break
+            first += page_size
+    return user_ids
+
+
+async def get_all_users() -> List[KeycloakUser]:
+    users = []
+    async for page in iter_users(settings.USER_DIRECTORY_PAGE_SIZE):
+        users.extend(page)
+    return users
+
+
+async def get_user_by_id(user_id: str) -> KeycloakUser:
+    # Ids come from request bodies; they must never change the admin path or query
+    if user_id in ("", ".", ".."):
+        raise HTTPException(status_code=404, detail=f"User not found with ID: {user_id}")
+    resp = await _admin_get(f"/users/{quote(user_id, safe='')}")
     if resp.status_code == 200:
         return KeycloakUser(**resp.json())
     if resp.status_code == 404:
@@ -87,22 +343,22 @@ def get_user_by_id(user_id: str) -> KeycloakUser:
     )
 
 
-def get_all_users_safely() -> list[KeycloakUser]:
+async def get_all_users_safely() -> list[KeycloakUser]:
     try:
-        return get_all_users()
+        return await get_all_users()
     except HTTPException as exc:
         print(f"\nError fetching users from keycloak:\n{exc}\n")
         return []
 
 
-def get_user_by_id_safely(
+async def get_user_by_id_safely(
     user_id: str,
     *,
     default_username: str = "",
     default_profile_pic_url: str = "",
 ) -> KeycloakUser:
     try:
-        return get_user_by_id(user_id)
+        return await get_user_by_id(user_id)
     except HTTPException as exc:
         print(f"\nError fetching user {user_id} from keycloak:\n{exc}\n")
         return KeycloakUser(username=default_username, profile_pic_url=default_profile_pic_url)
@@ -0,0 +1,142 @@
+"""
+Streaming export of projects (and optionally their feedback) as NDJSON or CSV.
+
+Projects are read in _id order straight off the Mongo cursor and each one is
+serialized as soon as it arrives, so memory stays flat whatever the size of
+the collection. With feedback, projects are grouped per cursor batch and the
+batch's feedback is read with one cursor, sorted the same way as the
+projects. Each project's feedback array is written item by item as the
+cursor advances, so a project with a lot of feedback is never held whole.
+
+Exports are resumable: pass the id of the last project received as `after`.
+"""
+import csv
+import io
+from typing import AsyncIterator, Callable, List, Literal, Optional
+
+from bson import ObjectId
+
+from core.serialization import document_payload, dumps
+from database import feedback as feedback_db
+from database import project as project_db
+from schemas.feedback import FeedbackResponse
+from schemas.project import ProjectSchema
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+CSV_COLUMNS = list(ProjectSchema.model_fields)
+
+# Records are coalesced into chunks of about this size before they are sent
+CHUNK_BYTES = 64 * 1024
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return dumps(value).decode()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def _csv_row(values: List) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([_csv_value(value) for value in values])
+    return buffer.getvalue().encode("utf-8")
+
+
+async def _batches(docs: AsyncIterator[dict], size: int) -> AsyncIterator[List[dict]]:
+    batch = []
+    async for doc in docs:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _with_feedback(
+    projects: AsyncIterator[dict],
+    batch_size: int,
+    prefix: Callable[[dict], bytes],
+    suffix: bytes,
+    encode: Callable[[dict], bytes],
+) -> AsyncIterator[bytes]:
+    """
+    For every project: prefix(project), its encoded feedback separated by
+    commas, then suffix. Projects come in _id order and feedback in
+    project_id order, so the two are merged in one pass.
+    """
+    async for batch in _batches(projects, batch_size):
+        feedback = feedback_db.iter_feedback_for_projects([str(doc["id"]) for doc in batch], batch_size)
+        pending = await anext(feedback, None)
+        for doc in batch:
+            project_id = str(doc["id"])
+            while pending is not None and pending["project_id"] < project_id:
+                # Feedback of a project deleted while the export ran
+                pending = await anext(feedback, None)
+            yield prefix(doc)
+            separator = b""
+            while pending is not None and pending["project_id"] == project_id:
+                yield separator + encode(document_payload(pending, FeedbackResponse))
+                separator = b","
+                pending = await anext(feedback, None)
+            yield suffix
+
+
+async def _coalesce(records: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    async for record in records:
+        buffer += record
+        if len(buffer) >= CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _records(
+    query: dict,
+    format: ExportFormat = "ndjson",
+    include_feedback: bool = False,
+    after: Optional[ObjectId] = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[bytes]:
+    projects = (
+        document_payload(raw, ProjectSchema)
+        async for raw in project_db.iter_projects(query, after, batch_size)
+    )
+    if format == "csv":
+        columns = CSV_COLUMNS + (["feedback"] if include_feedback else [])
+        yield _csv_row(columns)
+        if include_feedback:
+            # The feedback cell is last: a quoted JSON array, with quotes doubled as CSV requires
+            def prefix(doc):
+                return _csv_row([doc.get(column) for column in CSV_COLUMNS]).rstrip(b"\r\n") + b',"['
+
+            async for piece in _with_feedback(projects, batch_size, prefix, b']"\r\n', lambda item: dumps(item).replace(b'"', b'""')):
+                yield piece
+        else:
+            async for doc in projects:
+                yield _csv_row([doc.get(column) for column in columns])
+    elif include_feedback:
+        async for piece in _with_feedback(projects, batch_size, lambda doc: dumps(doc)[:-1] + b',"feedback":[', b"]}\n", dumps):
+            yield piece
+    else:
+        async for doc in projects:
+            yield dumps(doc) + b"\n"
+
+
+def export_projects(
+    query: dict,
+    format: ExportFormat = "ndjson",
+    include_feedback: bool = False,
+    after: Optional[ObjectId] = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[bytes]:
+    """Encoded export chunks: one line per project, CSV starting with a header row."""
+    return _coalesce(_records(query, format, include_feedback, after, batch_size))
@@ -0,0 +1,135 @@
+"""
+Streaming NDJSON import of projects.
+
+Input is one ProjectCreateSchema JSON object per line. Lines are read
+incrementally and written in batches of `batch_size` with an unordered,
+upserting bulk_write keyed on (topic, batch), so re-running an import
+updates instead of duplicating. Memory use is bounded by one batch plus one
+line, whatever the size of the upload.
+
+One result per non-blank line is produced as soon as it is known: invalid
+lines right away, valid ones when their batch is written, so results are
+not strictly in line order. A final {"summary": ...} line closes the stream.
+
+From the command line:
+
+    python -m services.project_import projects.ndjson --batch-size 1000
+"""
+import argparse
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from core.config import settings
+from database import project as project_db
+from schemas.project import ProjectCreateSchema
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Optional[bytes]]:
+    """
+    Split a byte stream into lines. A line longer than `max_line_bytes` is
+    discarded while it is read and reported as None.
+    """
+    buffer = bytearray()
+    overflow = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end == -1:
+                if not overflow:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_bytes:
+                        overflow = True
+                        buffer.clear()
+                break
+            if overflow or len(buffer) + end - start > max_line_bytes:
+                yield None
+            else:
+                buffer += chunk[start:end]
+                yield bytes(buffer)
+            buffer.clear()
+            overflow = False
+            start = end + 1
+    if overflow:
+        yield None
+    elif buffer:
+        yield bytes(buffer)
+
+
+def _validation_detail(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'line'}: {item['msg']}"
+        for item in error.errors(include_url=False)
+    )
+
+
+async def _write(pending: List[Tuple[int, dict]]) -> List[dict]:
+    results = await project_db.upsert_projects([doc for _, doc in pending])
+    return [
+        {"line": line, "status": status, "id": str(id) if id is not None else None, "detail": detail}
+        for (line, _), (status, id, detail) in zip(pending, results)
+    ]
+
+
+async def import_projects(chunks: AsyncIterator[bytes], batch_size: int = settings.IMPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """Import NDJSON projects from a byte stream, yielding one result dict per line and a final summary."""
+    summary = {"created": 0, "updated": 0, "invalid": 0, "error": 0}
+    pending: List[Tuple[int, dict]] = []
+    line_number = 0
+    async for line in ndjson_lines(chunks, settings.IMPORT_MAX_LINE_BYTES):
+        line_number += 1
+        if line is None:
+            detail = "Line too long"
+        elif not line.strip():
+            continue
+        else:
+            try:
+                pending.append((line_number, ProjectCreateSchema.model_validate_json(line).model_dump(exclude_unset=True)))
+                detail = None
+            except ValidationError as e:
+                detail = _validation_detail(e)
+        if detail is not None:
+            summary["invalid"] += 1
+            yield {"line": line_number, "status": "invalid", "id": None, "detail": detail}
+        elif len(pending) >= batch_size:
+            for result in await _write(pending):
+                summary[result["status"]] += 1
+                yield result
+            pending = []
+
+    if pending:
+        for result in await _write(pending):
+            summary[result["status"]] += 1
+            yield result
+    yield {"summary": summary}
+
+
+async def _read_file(path: str, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+async def main() -> None:
+    from core.database import close_db_connection, init_db
+
+    parser = argparse.ArgumentParser(description="Import projects from an NDJSON file.")
+    parser.add_argument("path")
+    parser.add_argument("--batch-size", type=int, default=settings.IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    await init_db()
+    try:
+        async for result in import_projects(_read_file(args.path), args.batch_size):
+            if "summary" in result:
+                print(f"Imported: {result['summary']}")
+            elif result["status"] in ("invalid", "error"):
+                print(f"Line {result['line']}: {result['status']}: {result['detail']}")
+    finally:
+        await close_db_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+Guarded outbound fetches of user-supplied URLs (thumbnails, image probes).
+
+Only http(s) is allowed, and unless FETCH_ALLOW_PRIVATE_HOSTS is set, every
+hop (including redirects) must resolve to public addresses only, so project
+URLs can't be used to reach internal services. The connection then goes to
+the address that was checked (Host header and TLS SNI keep the original
+name), so a second DNS answer can't point it somewhere else (DNS rebinding).
+"""
+import asyncio
+import ipaddress
+import socket
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+from core.config import settings
+
+MAX_REDIRECTS = 5
+
+
+class UnsafeURL(ValueError):
+    """Raised for URLs that may not be fetched."""
+
+
+async def check_public_url(url: str) -> Optional[str]:
+    """Validate `url` and return the public IP address to connect to (None when private hosts are allowed)."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise UnsafeURL("Only http(s) URLs are supported")
+    if settings.FETCH_ALLOW_PRIVATE_HOSTS:
+        return None
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, parts.port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM
+        )
+    except socket.gaierror as e:
+        raise UnsafeURL(f"Could not resolve {parts.hostname}: {e}")
+    if not addresses:
+        raise UnsafeURL(f"Could not resolve {parts.hostname}")
+    for *_, sockaddr in addresses:
+        if not ipaddress.ip_address(sockaddr[0]).is_global:
+            raise UnsafeURL(f"Refusing to fetch from non-public address {sockaddr[0]}")
+    return addresses[0][4][0]
+
+
+@asynccontextmanager
+async def stream_url(client: httpx.AsyncClient, url: str, headers: Optional[dict] = None) -> AsyncIterator[Tuple[httpx.Response, str]]:
+    """
+    GET `url` as a streamed response, following redirects and checking every
+    hop. Yields the response and the URL it came from (with the hostname, not
+    the pinned address, so relative links resolve against it).
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        address = await check_public_url(url)
+        target = httpx.URL(url)
+        extensions = {}
+        hop_headers = dict(headers or {})
+        if address is not None:
+            hop_headers["Host"] = target.netloc.decode("ascii")
+            extensions["sni_hostname"] = target.host
+            target = target.copy_with(host=address)
+        async with client.stream("GET", target, headers=hop_headers, extensions=extensions) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers["location"])
+                continue
+            yield response, url
+            return
+    raise httpx.TooManyRedirects(f"More than {MAX_REDIRECTS} redirects")
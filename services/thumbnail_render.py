@@ -0,0 +1,30 @@
+"""
+CPU-bound part of thumbnail generation, run in worker processes.
+
+Kept free of app imports so spawned workers start quickly.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+FORMATS = {"webp": "WEBP", "jpeg": "JPEG", "png": "PNG"}
+
+
+def render_thumbnail(data: bytes, width: int, height: int, format: str, quality: int) -> bytes:
+    """Decode `data` and shrink it to fit in width x height, keeping the aspect ratio."""
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            # Lets JPEG decode at a reduced scale instead of full size
+            source.draft("RGB", (width, height))
+            image = ImageOps.exif_transpose(source)
+            image.thumbnail((width, height), Image.Resampling.LANCZOS)
+            if format == "jpeg":
+                image = image.convert("RGB")
+            elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+                image = image.convert("RGBA" if "transparency" in image.info or "A" in image.mode else "RGB")
+            output = io.BytesIO()
+            image.save(output, format=FORMATS[format], quality=quality, optimize=True)
+            return output.getvalue()
+    except (Image.DecompressionBombError, OSError, SyntaxError) as e:
+        # Re-raised as a plain ValueError so it pickles back to the parent process
+        raise ValueError(f"Could not decode image: {e}") from None
@@ -1,2 +1,293 @@
-def generate_thumbnail(thumbnail):
-    return {"title": thumbnail.title, "weburl": thumbnail.weburl}
+"""
+Thumbnail pipeline: fetch, resize in a process pool, cache on disk.
+
+The source is fetched with httpx. If it is an HTML page, its og:image (or
+twitter:image) is used instead. Decoding and resizing run in a
+ProcessPoolExecutor so the event loop stays free.
+
+Results go into a content-addressed on-disk cache keyed by URL, size,
+format and quality, and are evicted least-recently-used once the cache
+exceeds THUMBNAIL_CACHE_MAX_BYTES. Concurrent requests for the same
+thumbnail share a single render. Several workers can share the cache
+directory: each one evicts by its own view of recency, and a file removed
+by another worker is simply a miss.
+
+Sources are fetched through services.remote_fetch, which refuses private
+addresses unless FETCH_ALLOW_PRIVATE_HOSTS is set.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from html import unescape
+from typing import Dict, Optional, Tuple
+from urllib.parse import urljoin
+
+import httpx
+
+from core.config import settings
+from services.remote_fetch import UnsafeURL, stream_url
+from services.thumbnail_render import FORMATS, render_thumbnail
+
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+_META_TAG = re.compile(rb"<meta\s[^>]*>", re.IGNORECASE)
+_ATTRIBUTE = re.compile(rb"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""")
+_PREVIEW_PROPERTIES = (b"og:image:secure_url", b"og:image", b"og:image:url", b"twitter:image")
+
+
+class ThumbnailError(Exception):
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _preview_image_url(html: bytes, base_url: str) -> Optional[str]:
+    """og:image / twitter:image of an HTML page, resolved against the page URL."""
+    found = {}
+    for tag in _META_TAG.findall(html):
+        attributes = {
+            match[0].lower(): match[1] or match[2] or match[3]
+            for match in _ATTRIBUTE.findall(tag)
+        }
+        key = (attributes.get(b"property") or attributes.get(b"name") or b"").lower()
+        if key in _PREVIEW_PROPERTIES and attributes.get(b"content"):
+            found.setdefault(key, attributes[b"content"])
+    for key in _PREVIEW_PROPERTIES:
+        if key in found:
+            return urljoin(base_url, unescape(found[key].decode("utf-8", "replace")).strip())
+    return None
+
+
+class ThumbnailCache:
+    """Content-addressed files under `directory`, evicted LRU by total size."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load(self) -> None:
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                found.append((stat.st_mtime, name, stat.st_size))
+        found.sort()
+        self._entries = OrderedDict((name, size) for _, name, size in found)
+        self._total = sum(self._entries.values())
+
+    async def load(self) -> None:
+        """Index what is already on disk, oldest first."""
+        await asyncio.to_thread(self._load)
+
+    def _remember(self, key: str, size: int) -> None:
+        self._total += size - self._entries.get(key, 0)
+        self._entries[key] = size
+        self._entries.move_to_end(key)
+
+    def _forget(self, key: str) -> None:
+        self._total -= self._entries.pop(key, 0)
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            # Recency survives restarts through the mtime
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = await asyncio.to_thread(self._read, key)
+        if data is None:
+            self._forget(key)
+        else:
+            self._remember(key, len(data))
+        return data
+
+    def _write(self, key: str, data: bytes, evict: list) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+        for old in evict:
+            try:
+                os.remove(self._path(old))
+            except FileNotFoundError:
+                pass
+
+    async def put(self, key: str, data: bytes) -> None:
+        self._remember(key, len(data))
+        evict = []
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            old, _ = next(iter(self._entries.items()))
+            self._forget(old)
+            evict.append(old)
+        await asyncio.to_thread(self._write, key, data, evict)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+class ThumbnailService:
+    def __init__(self, cache: ThumbnailCache, workers: int, client: Optional[httpx.AsyncClient] = None):
+        self.cache = cache
+        self.workers = workers
+        self._client = client
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self.render_seconds = 0.0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=settings.THUMBNAIL_FETCH_TIMEOUT,
+                headers={"User-Agent": f"{settings.PROJECT_NAME} thumbnailer"},
+            )
+        return self._client
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and driver threads isn't safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers or None,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def start(self) -> None:
+        await self.cache.load()
+        self._get_executor()
+
+    async def stop(self) -> None:
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "renders": self.renders,
+            "avg_render_ms": round(self.render_seconds / self.renders * 1000, 3) if self.renders else 0.0,
+            "inflight": len(self._inflight),
+            **self.cache.stats(),
+        }
+
+    async def _fetch(self, url: str) -> Tuple[bytes, str, str]:
+        """(body, content type, final URL)."""
+        try:
+            async with stream_url(self._get_client(), url) as (response, final_url):
+                if response.status_code != 200:
+                    raise ThumbnailError(f"Source returned HTTP {response.status_code}")
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body += chunk
+                    if len(body) > settings.THUMBNAIL_MAX_SOURCE_BYTES:
+                        raise ThumbnailError("Source is too large", status_code=413)
+                content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                return bytes(body), content_type, final_url
+        except UnsafeURL as e:
+            raise ThumbnailError(str(e), status_code=400)
+        except httpx.HTTPError as e:
+            raise ThumbnailError(f"Could not fetch {url}: {e}")
+
+    async def _source_image(self, url: str) -> bytes:
+        body, content_type, final_url = await self._fetch(url)
+        if content_type in ("text/html", "application/xhtml+xml"):
+            image_url = _preview_image_url(body, final_url)
+            if image_url is None:
+                raise ThumbnailError("Page has no og:image to build a thumbnail from", status_code=422)
+            body, content_type, _ = await self._fetch(image_url)
+            if content_type.startswith("text/"):
+                raise ThumbnailError("Page's preview image is not an image", status_code=422)
+        return body
+
+    async def _render(self, key: str, url: str, width: int, height: int, format: str) -> bytes:
+        source = await self._source_image(url)
+        started = time.perf_counter()
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), render_thumbnail, source, width, height, format, settings.THUMBNAIL_QUALITY
+            )
+        except ValueError as e:
+            raise ThumbnailError(str(e), status_code=422)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool for the next render
+            self._executor = None
+            raise ThumbnailError("Thumbnail worker crashed", status_code=503)
+        self.renders += 1
+        self.render_seconds += time.perf_counter() - started
+        await self.cache.put(key, data)
+        return data
+
+    @staticmethod
+    def cache_key(url: str, width: int, height: int, format: str) -> str:
+        raw = f"{url}\n{width}x{height}\n{format}\n{settings.THUMBNAIL_QUALITY}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def get(self, url: str, width: int, height: int, format: str) -> Tuple[bytes, str]:
+        """Thumbnail bytes fitting in width x height, and the cache key (usable as an ETag)."""
+        if format not in FORMATS:
+            raise ThumbnailError(f"Unsupported format {format}", status_code=400)
+        key = self.cache_key(url, width, height, format)
+        data = await self.cache.get(key)
+        if data is not None:
+            self.hits += 1
+            return data, key
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._render(key, url, width, height, format))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one caller going away doesn't cancel the render for the others
+        return await asyncio.shield(task), key
+
+
+thumbnail_service = ThumbnailService(
+    ThumbnailCache(settings.THUMBNAIL_CACHE_DIR, settings.THUMBNAIL_CACHE_MAX_BYTES),
+    workers=settings.THUMBNAIL_WORKERS,
+)
+
+
+def thumbnail_params(width: Optional[int], height: Optional[int], format: Optional[str]) -> Tuple[int, int, str]:
+    """Requested (width, height, format) with the defaults applied; height defaults to width."""
+    width = width or settings.THUMBNAIL_DEFAULT_WIDTH
+    return width, height or width, format or settings.THUMBNAIL_DEFAULT_FORMAT
+
+
+def thumbnail_key(thumbnail) -> str:
+    """Cache key (and ETag) `generate_thumbnail` will return for this request, without rendering it."""
+    return ThumbnailService.cache_key(thumbnail.weburl, *thumbnail_params(thumbnail.width, thumbnail.height, thumbnail.format))
+
+
+async def generate_thumbnail(thumbnail) -> Tuple[bytes, str, str]:
+    """Render the thumbnail described by a `schemas.thumbnail.thumbnail` request: (bytes, media type, key)."""
+    width, height, format = thumbnail_params(thumbnail.width, thumbnail.height, thumbnail.format)
+    data, key = await thumbnail_service.get(thumbnail.weburl, width, height, format)
+    return data, MEDIA_TYPES[format], key
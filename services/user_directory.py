@@ -0,0 +1,234 @@
+import asyncio
+import bisect
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from core.config import settings
+from schemas.keycloak import KeycloakUser
+from services.keycloak import changed_user_ids, get_user_by_id, iter_users
+
+# Event windows overlap by this much (seconds) to absorb clock skew with Keycloak
+EVENT_OVERLAP = 60
+
+
+def _sort_key(user: KeycloakUser) -> str:
+    return user.username.lower()
+
+
+class UserDirectory:
+    """
+    In-memory copy of the Keycloak realm's users, indexed by id, username and email.
+
+    A full sync streams the realm page by page into a fresh index which then
+    replaces the current one, so readers never see a half-synced directory.
+    In between, every `sync_interval` only the users named in Keycloak's
+    admin/user events since the last pass are refetched (or dropped), and a
+    full sync runs every `full_sync_interval` to catch anything events
+    missed (e.g. events disabled on the realm). Users fetched individually
+    are also added as they are looked up.
+    """
+
+    def __init__(self, page_size: int, sync_interval: float, full_sync_interval: float):
+        self.page_size = page_size
+        self.sync_interval = sync_interval
+        self.full_sync_interval = full_sync_interval
+        self.synced_at: Optional[float] = None
+        self.full_synced_at: Optional[float] = None
+        self._by_id: Dict[str, KeycloakUser] = {}
+        self._by_username: Dict[str, KeycloakUser] = {}
+        self._by_email: Dict[str, KeycloakUser] = {}
+        self._ordered: List[KeycloakUser] = []
+        self._search_text: Dict[str, str] = {}
+        self._sync_lock = asyncio.Lock()
+        self._sync_task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.synced_at is not None
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    async def sync(self) -> None:
+        """Rebuild the index from Keycloak."""
+        async with self._sync_lock:
+            started = time.time()
+            users: Dict[str, KeycloakUser] = {}
+            async for page in iter_users(self.page_size):
+                for user in page:
+                    if user.id:
+                        users[user.id] = user
+            self._replace(users)
+            self.synced_at = self.full_synced_at = started
+
+    async def sync_changes(self) -> int:
+        """Refetch the users created, changed or deleted since the last sync. Returns how many were seen."""
+        async with self._sync_lock:
+            started = time.time()
+            user_ids = await changed_user_ids(self.synced_at - EVENT_OVERLAP, self.page_size)
+            for user_id in user_ids:
+                try:
+                    self.add(await get_user_by_id(user_id))
+                except HTTPException as exc:
+                    if exc.status_code != 404:
+                        raise
+                    self.remove(user_id)
+                except ValidationError as exc:
+                    print(f"Skipping Keycloak user {user_id}: {exc}")
+            self.synced_at = started
+            return len(user_ids)
+
+    def _replace(self, users: Dict[str, KeycloakUser]) -> None:
+        by_username = {}
+        by_email = {}
+        search_text = {}
+        for user_id, user in users.items():
+            by_username[user.username.lower()] = user
+            if user.email:
+                by_email[user.email.lower()] = user
+            search_text[user_id] = self._haystack(user)
+        self._by_id = users
+        self._by_username = by_username
+        self._by_email = by_email
+        self._search_text = search_text
+        self._ordered = sorted(users.values(), key=_sort_key)
+
+    @staticmethod
+    def _haystack(user: KeycloakUser) -> str:
+        parts = (user.username, user.email, user.firstName, user.lastName)
+        return "\n".join(p.lower() for p in parts if p)
+
+    def add(self, user: KeycloakUser) -> None:
+        """Add or replace a single user without waiting for the next sync."""
+        if not user.id:
+            return
+        previous = self._by_id.get(user.id)
+        if previous is not None:
+            self._ordered.remove(previous)
+            self._by_username.pop(previous.username.lower(), None)
+            if previous.email:
+                self._by_email.pop(previous.email.lower(), None)
+        self._by_id[user.id] = user
+        self._by_username[user.username.lower()] = user
+        if user.email:
+            self._by_email[user.email.lower()] = user
+        self._search_text[user.id] = self._haystack(user)
+        bisect.insort(self._ordered, user, key=_sort_key)
+
+    def remove(self, user_id: str) -> None:
+        user = self._by_id.pop(user_id, None)
+        if user is None:
+            return
+        self._ordered.remove(user)
+        self._by_username.pop(user.username.lower(), None)
+        if user.email:
+            self._by_email.pop(user.email.lower(), None)
+        self._search_text.pop(user_id, None)
+
+    def get(self, user_id: str) -> Optional[KeycloakUser]:
+        return self._by_id.get(user_id)
+
+    def get_by_username(self, username: str) -> Optional[KeycloakUser]:
+        return self._by_username.get(username.lower())
+
+    def get_by_email(self, email: str) -> Optional[KeycloakUser]:
+        return self._by_email.get(email.lower())
+
+    def search(self, query: Optional[str] = None, first: int = 0, max_results: int = 100) -> List[KeycloakUser]:
+        """Case-insensitive substring match on username, email and names, ordered by username."""
+        if not query:
+            return self._ordered[first:first + max_results]
+        needle = query.lower()
+        matches = []
+        skipped = 0
+        for user in self._ordered:
+            if needle in self._search_text.get(user.id, ""):
+                if skipped < first:
+                    skipped += 1
+                    continue
+                matches.append(user)
+                if len(matches) >= max_results:
+                    break
+        return matches
+
+    async def resolve(
+        self,
+        user_ids: List[str],
+        *,
+        concurrency: int,
+        default_username: str = "",
+        default_profile_pic_url: str = "",
+    ) -> Tuple[Dict[str, KeycloakUser], Dict[str, str]]:
+        """
+        Resolve many users at once. Ids are deduplicated, served from the index
+        where possible and the rest fetched concurrently (at most `concurrency`
+        at a time). Failed lookups get the same placeholder user as
+        `get_user_by_id_safely`, and their error is reported per id.
+        """
+        unique_ids = list(dict.fromkeys(user_ids))
+        users: Dict[str, KeycloakUser] = {}
+        errors: Dict[str, str] = {}
+        missing = []
+        for user_id in unique_ids:
+            user = self.get(user_id)
+            if user is not None:
+                users[user_id] = user
+            else:
+                missing.append(user_id)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(user_id: str) -> None:
+            async with semaphore:
+                try:
+                    user = await get_user_by_id(user_id)
+                except HTTPException as exc:
+                    errors[user_id] = str(exc.detail)
+                    users[user_id] = KeycloakUser(username=default_username, profile_pic_url=default_profile_pic_url)
+                    return
+                except (ValidationError, TypeError, ValueError) as exc:
+                    # Malformed account (e.g. an invalid stored email) or not a user object
+                    errors[user_id] = f"Invalid user data from Keycloak: {exc}"
+                    users[user_id] = KeycloakUser(username=default_username, profile_pic_url=default_profile_pic_url)
+                    return
+            self.add(user)
+            users[user_id] = user
+
+        await asyncio.gather(*(fetch(user_id) for user_id in missing))
+        return {user_id: users[user_id] for user_id in unique_ids}, errors
+
+    async def start(self) -> None:
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync_periodically())
+
+    async def stop(self) -> None:
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+
+    async def _sync_periodically(self) -> None:
+        while True:
+            try:
+                if self.full_synced_at is None or time.time() - self.full_synced_at >= self.full_sync_interval:
+                    await self.sync()
+                else:
+                    await self.sync_changes()
+            except HTTPException as exc:
+                print(f"Error syncing user directory from Keycloak: {exc.detail}")
+            except Exception as exc:
+                print(f"Error syncing user directory from Keycloak: {exc}")
+            await asyncio.sleep(self.sync_interval)
+
+
+user_directory = UserDirectory(
+    page_size=settings.USER_DIRECTORY_PAGE_SIZE,
+    sync_interval=settings.USER_DIRECTORY_SYNC_INTERVAL,
+    full_sync_interval=settings.USER_DIRECTORY_FULL_SYNC_INTERVAL,
+)
@@ -0,0 +1,16 @@
+"""
+Shared test setup. Settings are read from the environment when core.config is
+first imported, so the required ones get placeholder values here; tests never
+reach MongoDB or Keycloak.
+"""
+import os
+
+for name, value in {
+    "MONGODB_URI": "mongodb://localhost:27017",
+    "MONGODB_DB": "portfolio_test",
+    "KEYCLOAK_URL": "http://keycloak.local",
+    "REALM": "test",
+    "CLIENT_ID": "test",
+    "CLIENT_SECRET": "test",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,177 @@
+"""
+services/image_probe.py against real image files served over HTTP.
+
+Images are generated with Pillow from random noise so they are much
+larger than the probe's byte budget. The server honours Range requests
+(unless told not to) and records what it was asked for and how much it sends.
+"""
+import asyncio
+import io
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from core.config import settings
+from services.image_probe import ImageProbe, ProbeError, image_size
+
+MAX_BYTES = 16 * 1024
+
+
+def _noise(size, mode="RGB") -> Image.Image:
+    width, height = size
+    return Image.frombytes(mode, size, os.urandom(width * height * len(mode)))
+
+
+def _encode(image: Image.Image, format: str, **params) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+def _jpeg_with_orientation(size, orientation: int) -> bytes:
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    return _encode(_noise(size), "JPEG", quality=95, exif=exif.tobytes())
+
+
+# name -> (file contents, size a browser displays)
+IMAGES = {
+    "image.png": (_encode(_noise((640, 480)), "PNG"), (640, 480)),
+    "image.gif": (_encode(_noise((320, 200)).convert("P"), "GIF"), (320, 200)),
+    "lossy.webp": (_encode(_noise((500, 300)), "WEBP", quality=90), (500, 300)),
+    "lossless.webp": (_encode(_noise((300, 500)), "WEBP", lossless=True), (300, 500)),
+    "alpha.webp": (_encode(_noise((401, 203), "RGBA"), "WEBP", quality=90), (401, 203)),
+    "upright.jpg": (_jpeg_with_orientation((600, 400), 1), (600, 400)),
+    "rotated.jpg": (_jpeg_with_orientation((600, 400), 6), (400, 600)),
+    "transposed.jpg": (_jpeg_with_orientation((600, 400), 5), (400, 600)),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    honour_range = True
+    requests = []
+
+    def do_GET(self):
+        name = self.path.lstrip("/")
+        if name not in IMAGES:
+            self.send_error(404)
+            return
+        body = IMAGES[name][0]
+        range_header = self.headers.get("Range")
+        status = 200
+        if range_header and self.honour_range:
+            start, end = range_header.split("=", 1)[1].split("-")
+            end = min(int(end), len(body) - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+            body = body[int(start):end + 1]
+            status = 206
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        # Recorded before the body goes out; the probe may hang up part way through
+        self.requests.append({"path": name, "range": range_header, "status": status, "sent": len(body)})
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(settings, "FETCH_ALLOW_PRIVATE_HOSTS", True)
+    _Handler.requests = []
+    _Handler.honour_range = True
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", _Handler
+    httpd.shutdown()
+    httpd.server_close()
+    thread.join()
+
+
+def _probe(urls, max_bytes=MAX_BYTES):
+    async def run():
+        probe = ImageProbe(concurrency=4, max_bytes=max_bytes, cache_ttl=60, cache_size=100)
+        try:
+            return await probe.probe_many(urls)
+        finally:
+            await probe.close()
+    return asyncio.run(run())
+
+
+def test_images_are_larger_than_the_probe_budget():
+    for name, (body, _) in IMAGES.items():
+        assert len(body) > 4 * MAX_BYTES, name
+
+
+@pytest.mark.parametrize("name", sorted(IMAGES))
+def test_image_size_from_full_file(name):
+    body, expected = IMAGES[name]
+    assert tuple(image_size(body)) == expected
+
+
+@pytest.mark.parametrize("name", sorted(IMAGES))
+def test_probe_reads_only_the_header(server, name):
+    base_url, handler = server
+    url = f"{base_url}/{name}"
+
+    result = _probe([url])
+
+    assert tuple(result[url]) == IMAGES[name][1]
+    assert len(handler.requests) == 1
+    request = handler.requests[0]
+    assert request["range"] == f"bytes=0-{MAX_BYTES - 1}"
+    assert request["status"] == 206
+    assert request["sent"] <= MAX_BYTES
+
+
+def test_probe_many_concurrently(server):
+    base_url, handler = server
+    urls = [f"{base_url}/{name}" for name in IMAGES]
+
+    result = _probe(urls + urls)
+
+    assert {url: tuple(size) for url, size in result.items()} == {
+        f"{base_url}/{name}": expected for name, (_, expected) in IMAGES.items()
+    }
+    assert len(handler.requests) == len(IMAGES)
+
+
+def test_probe_without_range_support(server):
+    base_url, handler = server
+    handler.honour_range = False
+    url = f"{base_url}/rotated.jpg"
+
+    result = _probe([url])
+
+    assert tuple(result[url]) == (400, 600)
+    assert handler.requests[0]["status"] == 200
+
+
+def test_probe_errors_are_returned(server):
+    base_url, _ = server
+    missing = f"{base_url}/missing.png"
+
+    result = _probe([missing])
+
+    assert isinstance(result[missing], ProbeError)
+
+
+def test_private_hosts_are_refused_by_default(server, monkeypatch):
+    base_url, handler = server
+    monkeypatch.setattr(settings, "FETCH_ALLOW_PRIVATE_HOSTS", False)
+    url = f"{base_url}/image.png"
+
+    result = _probe([url])
+
+    assert isinstance(result[url], ProbeError)
+    assert handler.requests == []